@@ -4,6 +4,10 @@ import threading
 import time
 import pickle
 import rsa
+from connection_pool import ConnectionPool
+from routing_table import apply_routing_update, compile_forwarding_table
+from wire import HEARTBEAT, MessageReader, node_ids, recv_frame
+from worker_pool import WorkerPool
 
 # Load RSA keys from files
 with open('pri_key.txt', 'rb') as file_pri:
@@ -30,11 +34,25 @@ class TCPNode:
         self.listen_port = listen_port
         self.outgoing_ports = outgoing_ports
         self.routing_table = None
+        self.forwarding_table = {}
+        self.subscription = None
 
         # Load port mapping from file
         with open("port_mapping.json", "r") as file:
             self.port_mapping = json.load(file)
 
+        # Numeric node ids carried in message headers
+        self.node_ids = node_ids(self.port_mapping)
+        self.node_names = {node_id: name for name, node_id in self.node_ids.items()}
+
+        # Persistent connections to the next hops, keyed by port
+        self.pool = ConnectionPool()
+
+        # Bounded pool of threads serving inbound connections. Every other node may keep one pooled connection
+        # open, holding a worker for as long as it lasts, so there is a worker for each of them plus 16 for
+        # clients and short-lived connections
+        self.workers = WorkerPool(len(self.port_mapping) - 1 + 16, 64, name=node_name)
+
     def start(self):
         """
         Starts the TCP node by initializing the server for incoming connections and connecting to the controller server.
@@ -51,11 +69,15 @@ class TCPNode:
         # Listen for incoming connections from other nodes in a separate thread
         threading.Thread(target=self.accept_connections, daemon=True).start()
 
+        # Receive routing table changes pushed by the controller server
+        threading.Thread(target=self.subscribe_to_server, daemon=True).start()
+
     def stop(self):
         """
-        Stops the TCP node by closing the server socket.
+        Stops the TCP node by closing the server socket and the pooled connections.
         """
         self.server_socket.close()
+        self.pool.close()
 
     def connect_to_server(self):
         """
@@ -64,122 +86,156 @@ class TCPNode:
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
                 client_socket.connect((self.server_host, self.server_port))
-                encrypted_node_name = rsa.encrypt(self.node_name.encode(), public_key)
+                # Send the version of the current table so that only its changes are returned
+                request = self.node_name if self.routing_table is None else f"{self.node_name}:{self.routing_table.request_version}"
+                encrypted_node_name = rsa.encrypt(request.encode(), public_key)
                 client_socket.sendall(encrypted_node_name)
-                routing_table_json = client_socket.recv(4096).decode()
-                self.routing_table = json.loads(routing_table_json)  # Assign the received routing table
+                routing_table_json = recv_frame(client_socket).decode()
+                self.install_routing_table(apply_routing_update(self.routing_table, json.loads(routing_table_json)))  # Assign the received routing table
                 print(f"ACK received from controller: {self.routing_table}")
         except Exception as e:
             print(f"Error while connecting to server: {e}")
 
+    def subscribe_to_server(self):
+        """
+        Keeps a subscription open with the controller server, which pushes routing table changes as soon as they
+        are computed. While it is open, keep_alive sends heartbeats on it instead of polling with connect_to_server.
+        """
+        while True:
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
+                    client_socket.connect((self.server_host, self.server_port))
+                    version = "" if self.routing_table is None else self.routing_table.request_version
+                    request = f"{self.node_name}:{version}:subscribe"
+                    client_socket.sendall(rsa.encrypt(request.encode(), public_key))
+                    while True:
+                        update = json.loads(recv_frame(client_socket).decode())
+                        self.install_routing_table(apply_routing_update(self.routing_table, update))
+                        # The first answer confirms the subscription
+                        self.subscription = client_socket
+                        print(f"Routing table version {self.routing_table.version} pushed by controller")
+            except Exception as e:
+                print(f"Subscription to server lost: {e}")
+            finally:
+                self.subscription = None
+            time.sleep(5)
+
+    def keep_alive(self):
+        """
+        Reports the node alive to the controller server: with a heartbeat on the subscription while it is open,
+        and otherwise by requesting the routing table with connect_to_server.
+        """
+        subscription = self.subscription
+        if subscription is not None:
+            try:
+                subscription.sendall(HEARTBEAT)
+                return
+            except OSError as e:
+                print(f"Subscription heartbeat failed: {e}")
+                # Wake the subscription thread up so that it subscribes again
+                try:
+                    subscription.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.connect_to_server()
+
+    def install_routing_table(self, routing_table):
+        """
+        Installs a routing table received from the controller and compiles its forwarding table.
+        The new forwarding table replaces the old one in a single assignment, so forwarding threads
+        never lock or see a partially built table.
+
+        Parameters:
+        routing_table (NodeRoutingTable): The updated routing table.
+        """
+        if routing_table is self.routing_table:
+            return
+        self.forwarding_table = compile_forwarding_table(routing_table, self.node_ids, self.channel_for)
+        self.routing_table = routing_table
+
+    def channel_for(self, next_hop):
+        """
+        Returns the pooled channel towards a next hop, or towards the client when the node itself is the next hop.
+        """
+        port = client_port if next_hop == self.node_name else self.port_mapping.get(next_hop)
+        return self.pool.channel(port) if port is not None else None
+
     def accept_connections(self):
         """
-        Accepts incoming connections from other nodes.
+        Accepts incoming connections from other nodes and hands them to the worker pool.
         """
         while True:
             try:
                 client_socket, client_address = self.server_socket.accept()
                 print(f"Node {self.node_name} accepted connection from {client_address}")
-                threading.Thread(target=self.handle_client, args=(client_socket,), daemon=True).start()
+                # Blocks while the queue is full, so no more connections are accepted until a worker is free
+                self.workers.submit(self.handle_client, client_socket)
             except Exception as e:
                 print(f"Error accepting connection: {e}")
 
     def handle_client(self, client_socket):
         """
-        Handles messages received from other nodes.
+        Handles messages received from other nodes. A connection may carry any number of messages.
+        Only their headers are parsed; payloads are relayed to the next hop unchanged.
 
         Parameters:
         client_socket (socket.socket): Client socket for communication.
         """
         try:
-            data = client_socket.recv(1024)
-            message_data = pickle.loads(data)
-            message_type = message_data.get("type")
-            origin_node = message_data.get("origin")
-            destination_node = message_data.get("destination")
-            user_message = message_data.get("message")
+            reader = MessageReader(client_socket)
+            while True:
+                # Only the header is read here; the payload is relayed or skipped by handle_user_message
+                header = reader.read_header()
+                if header is None:
+                    break
 
-            # Call the method to handle the user message
-            self.handle_user_message(message_type, origin_node, destination_node, user_message)
+                # Call the method to handle the user message
+                self.handle_user_message(header, reader)
 
         except Exception as e:
             print(f"Error handling client: {e}")
         finally:
             client_socket.close()
 
-    def connect_to_node(self, destination_node_name, position, message):
-        """
-        Connects to a destination node and sends a message.
-
-        Parameters:
-        destination_node_name (str): Name of the destination node.
-        position (int): Index of the outgoing port to use.
-        message (str): Message to send.
-        """
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-                client_socket.connect(("localhost", self.outgoing_ports[position]))
-                client_socket.sendall(destination_node_name.encode())
-                print(f"Node {self.node_name} connected to {destination_node_name} on port {self.outgoing_ports[position]}")
-                client_socket.sendall(message.encode())  # Send a message to the destination node
-        except Exception as e:
-            print(f"Error while connecting to node {destination_node_name} on port {self.outgoing_ports[position]}: {e}")
-
-    def handle_user_message(self, message_type, origin_node, destination_node, user_message):
+    def handle_user_message(self, header, reader):
         """
         Handles a user message received from another node.
 
         Parameters:
-        message_type (str): Type of the message.
-        origin_node (str): Name of the origin node.
-        destination_node (str): Name of the destination node.
-        user_message (str): User message content.
+        header (wire.Header): Header of the message.
+        reader (wire.MessageReader): Reader positioned on the encrypted payload of the message.
         """
-        print(f"Received user message from {origin_node} to {destination_node}: {user_message}")
+        origin_node = self.node_names.get(header.origin)
+        destination_node = self.node_names.get(header.destination)
+        print(f"Received user message from {origin_node} to {destination_node}: {header.length} bytes")
+        if header.ttl == 0:
+            print(f"TTL expired for message from {origin_node} to {destination_node}. Dropping it.")
+            reader.skip(header)
+            return
 
-        # Forward the user message using route_message
-        self.route_message(destination_node, {
-            "type": message_type,
-            "origin": origin_node,
-            "destination": destination_node,
-            "message": user_message
-        })
+        # Forward the user message using route_message, with the TTL decremented and the payload unchanged
+        self.route_message(destination_node, header._replace(ttl=header.ttl - 1), reader)
 
-    def route_message(self, destination_node_name, message):
+    def route_message(self, destination_node_name, header, reader):
         """
         Routes a message to a destination node.
 
         Parameters:
         destination_node_name (str): Name of the destination node.
-        message (dict): Message to be routed.
-        """
-        # Check if the destination is in the routing table
-        if destination_node_name in self.routing_table:
-            # Get the shortest path to the destination node
-            path_to_destination = self.routing_table[destination_node_name]
-
-            # Check if the path is valid (must contain at least two nodes: source and next hop)
-            if len(path_to_destination) > 1:
-                # Get the next hop (second node in the path)
-                next_hop = path_to_destination[1]
-
-                # Get the outgoing port for the next hop from the port_mapping dictionary
-                next_hop_port = self.port_mapping[next_hop]
-
-                if next_hop_port is not None:
-                    # Establish connection with the next hop
-                    self.connect_to_node(destination_node_name, next_hop_port, pickle.dumps(message))
-                    print(f"Node {self.node_name} routed message to {destination_node_name} via {next_hop}")
-                else:
-                    print(f"No outgoing port found for next hop {next_hop}.")
-            else:
-                # If the current node is the destination node, send the message back to the receiving client
-                print(f"Node {self.node_name} is the destination node. Sending message back to client.")
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-                    client_socket.connect(("localhost", client_port))  # Connect to the client's listening port
-                    client_socket.sendall(pickle.dumps(message))
+        header (wire.Header): Header to send in front of the payload.
+        reader (wire.MessageReader): Reader positioned on the payload of the message.
+        """
+        # Look up the outbound channel towards the destination in the compiled forwarding table
+        channel = self.forwarding_table.get(header.destination)
+        if channel is not None:
+            try:
+                channel.relay(header, reader)  # Send the message towards the destination node
+                print(f"Node {self.node_name} routed message to {destination_node_name} via port {channel.port}")
+            except Exception as e:
+                print(f"Error while sending to {destination_node_name} on port {channel.port}: {e}")
         else:
             print(f"No route found to {destination_node_name}")
+            reader.skip(header)
 
 
 # Ejemplo de uso
@@ -194,5 +250,7 @@ if __name__ == "__main__":
     node.start()
 
     while True:
-        node.connect_to_server()
+        node.keep_alive()
+        # Report the inbound and outbound queue depths
+        print(f"Workers: {node.workers.stats()}, outbound queues: {node.pool.queue_depths()}")
         time.sleep(15)
@@ -4,6 +4,10 @@ import threading
 import time
 import pickle
 import rsa
+from connection_pool import ConnectionPool
+from routing_table import apply_routing_update, compile_forwarding_table
+from wire import HEARTBEAT, MessageReader, node_ids, recv_frame
+from worker_pool import WorkerPool
 
 # Cargar claves RSA desde archivos
 with open('pri_key.txt', 'rb') as file_pri:
@@ -20,11 +24,25 @@ class TCPNode:
         self.listen_port = listen_port
         self.outgoing_ports = outgoing_ports
         self.routing_table = None
+        self.forwarding_table = {}
+        self.subscription = None
 
         # Cargar el mapeo de puertos desde el archivo
         with open("port_mapping.json", "r") as file:
             self.port_mapping = json.load(file)
 
+        # Identificadores numéricos de nodo usados en las cabeceras de los mensajes
+        self.node_ids = node_ids(self.port_mapping)
+        self.node_names = {node_id: name for name, node_id in self.node_ids.items()}
+
+        # Conexiones persistentes hacia los siguientes saltos, indexadas por puerto
+        self.pool = ConnectionPool()
+
+        # Grupo acotado de hilos para las conexiones entrantes. Cada uno de los demás nodos puede mantener abierta
+        # una conexión persistente, que ocupa un hilo mientras dure, así que hay un hilo para cada uno de ellos
+        # más 16 para los clientes y las conexiones breves
+        self.workers = WorkerPool(len(self.port_mapping) - 1 + 16, 64, name=node_name)
+
     def start(self):
         # Iniciar servidor para conexiones entrantes
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -38,97 +56,133 @@ class TCPNode:
         # Escuchar conexiones entrantes de otros nodos en un hilo separado
         threading.Thread(target=self.accept_connections, daemon=True).start()
 
+        # Recibir los cambios de la tabla de enrutamiento enviados por el controlador
+        threading.Thread(target=self.subscribe_to_server, daemon=True).start()
+
     def stop(self):
         # Detener el servidor y cerrar conexiones
         self.server_socket.close()
+        self.pool.close()
 
     def connect_to_server(self):
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
                 client_socket.connect((self.server_host, self.server_port))
-                encrypted_node_name = rsa.encrypt(self.node_name.encode(), public_key)
+                # Enviar la versión de la tabla actual para recibir solo sus cambios
+                request = self.node_name if self.routing_table is None else f"{self.node_name}:{self.routing_table.request_version}"
+                encrypted_node_name = rsa.encrypt(request.encode(), public_key)
                 client_socket.sendall(encrypted_node_name)
-                routing_table_json = client_socket.recv(4096).decode()
-                self.routing_table = json.loads(routing_table_json)  # Asignar la tabla de enrutamiento recibida
+                routing_table_json = recv_frame(client_socket).decode()
+                self.install_routing_table(apply_routing_update(self.routing_table, json.loads(routing_table_json)))  # Asignar la tabla de enrutamiento recibida
                 print(f"ACK received from controller: {self.routing_table}")
         except Exception as e:
             print(f"Error while connecting to server: {e}")
 
+    def subscribe_to_server(self):
+        # Mantener una suscripción abierta con el controlador, que envía los cambios de la tabla
+        # de enrutamiento en cuanto se calculan. Mientras está abierta, keep_alive envía latidos por ella
+        # en lugar de consultar con connect_to_server.
+        while True:
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
+                    client_socket.connect((self.server_host, self.server_port))
+                    version = "" if self.routing_table is None else self.routing_table.request_version
+                    request = f"{self.node_name}:{version}:subscribe"
+                    client_socket.sendall(rsa.encrypt(request.encode(), public_key))
+                    while True:
+                        update = json.loads(recv_frame(client_socket).decode())
+                        self.install_routing_table(apply_routing_update(self.routing_table, update))
+                        # La primera respuesta confirma la suscripción
+                        self.subscription = client_socket
+                        print(f"Routing table version {self.routing_table.version} pushed by controller")
+            except Exception as e:
+                print(f"Subscription to server lost: {e}")
+            finally:
+                self.subscription = None
+            time.sleep(5)
+
+    def keep_alive(self):
+        # Informar al controlador de que el nodo sigue activo: con un latido por la suscripción mientras
+        # está abierta, y si no, pidiendo la tabla de enrutamiento con connect_to_server
+        subscription = self.subscription
+        if subscription is not None:
+            try:
+                subscription.sendall(HEARTBEAT)
+                return
+            except OSError as e:
+                print(f"Subscription heartbeat failed: {e}")
+                # Despertar al hilo de la suscripción para que vuelva a suscribirse
+                try:
+                    subscription.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.connect_to_server()
+
+    def install_routing_table(self, routing_table):
+        # Compilar la tabla de reenvío (id de destino -> canal de salida) solo cuando la tabla cambia.
+        # Se sustituye con una única asignación, sin bloqueos en los hilos de reenvío.
+        if routing_table is self.routing_table:
+            return
+        self.forwarding_table = compile_forwarding_table(routing_table, self.node_ids, self.channel_for)
+        self.routing_table = routing_table
+
+    def channel_for(self, next_hop):
+        # Canal hacia el siguiente salto, o hacia el cliente cuando el siguiente salto es el propio nodo
+        port = client_port if next_hop == self.node_name else self.port_mapping.get(next_hop)
+        return self.pool.channel(port) if port is not None else None
+
     def accept_connections(self):
         while True:
             try:
                 client_socket, client_address = self.server_socket.accept()
                 print(f"Node {self.node_name} accepted connection from {client_address}")
-                threading.Thread(target=self.handle_client, args=(client_socket,), daemon=True).start()
+                # Se bloquea mientras la cola está llena, y no se aceptan más conexiones hasta que un hilo quede libre
+                self.workers.submit(self.handle_client, client_socket)
             except Exception as e:
                 print(f"Error accepting connection: {e}")
 
     def handle_client(self, client_socket):
         try:
-            data = client_socket.recv(1024)
-            message_data = pickle.loads(data)
-            message_type = message_data.get("tipo")
-            origin_node = message_data.get("origen")
-            destination_node = message_data.get("destino")
-            user_message = message_data.get("mensaje")
+            # Una conexión puede transportar cualquier número de mensajes
+            reader = MessageReader(client_socket)
+            while True:
+                # Aquí solo se lee la cabecera; handle_user_message reenvía o descarta el contenido
+                header = reader.read_header()
+                if header is None:
+                    break
 
-            # Llamar al método que maneja el mensaje de usuario
-            self.handle_user_message(message_type, origin_node, destination_node, user_message)
+                # Llamar al método que maneja el mensaje de usuario
+                self.handle_user_message(header, reader)
 
         except Exception as e:
             print(f"Error handling client: {e}")
         finally:
             client_socket.close()
 
-    def connect_to_node(self, destination_node_name, position, message):
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-                client_socket.connect(("localhost", self.outgoing_ports[position]))
-                client_socket.sendall(destination_node_name.encode())
-                print(f"Node {self.node_name} connected to {destination_node_name} on port {self.outgoing_ports[position]}")
-                client_socket.sendall(message.encode())  # Envía un mensaje al nodo destino
-        except Exception as e:
-            print(f"Error while connecting to node {destination_node_name} on port {self.outgoing_ports[position]}: {e}")
-
-    def handle_user_message(self, message_type, origin_node, destination_node, user_message):
-        print(f"Received user message from {origin_node} to {destination_node}: {user_message}")
-
-        # Reenviar el mensaje de usuario utilizando route_message
-        self.route_message(destination_node, {
-            "tipo": message_type,
-            "origen": origin_node,
-            "destino": destination_node,
-            "mensaje": user_message
-        })
-
-    def route_message(self, destination_node_name, message):
-        # Verificar si el destino está en la tabla de enrutamiento
-        if destination_node_name in self.routing_table:
-            # Obtener el camino más corto al nodo destino
-            path_to_destination = self.routing_table[destination_node_name]
-
-            # Verificar si el camino es válido (debe contener al menos dos nodos: origen y siguiente salto)
-            if len(path_to_destination) > 1:
-                # Obtener el siguiente salto (segundo nodo en el camino)
-                next_hop = path_to_destination[1]
-
-                # Obtener el puerto de salida para el siguiente salto del diccionario port_mapping
-                next_hop_port = self.port_mapping[next_hop]
-
-                if next_hop_port is not None:
-                    # Establecer conexión con el siguiente salto
-                    self.connect_to_node(destination_node_name, next_hop_port, pickle.dumps(message))
-                    print(f"Node {self.node_name} routed message to {destination_node_name} via {next_hop}")
-                else:
-                    print(f"No outgoing port found for next hop {next_hop}.")
-            else:
-                # Si el nodo actual es el nodo destino, enviar el mensaje de vuelta al cliente receptor
-                print(f"Node {self.node_name} is the destination node. Sending message back to client.")
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-                    client_socket.connect(("localhost", client_port))  # Conectarse al puerto de escucha del cliente
-                    client_socket.sendall(pickle.dumps(message))
+    def handle_user_message(self, header, reader):
+        origin_node = self.node_names.get(header.origin)
+        destination_node = self.node_names.get(header.destination)
+        print(f"Received user message from {origin_node} to {destination_node}: {header.length} bytes")
+        if header.ttl == 0:
+            print(f"TTL expired for message from {origin_node} to {destination_node}. Dropping it.")
+            reader.skip(header)
+            return
+
+        # Reenviar el mensaje de usuario utilizando route_message, con el TTL decrementado y el contenido sin cambios
+        self.route_message(destination_node, header._replace(ttl=header.ttl - 1), reader)
+
+    def route_message(self, destination_node_name, header, reader):
+        # Buscar el canal de salida hacia el destino en la tabla de reenvío compilada
+        channel = self.forwarding_table.get(header.destination)
+        if channel is not None:
+            try:
+                channel.relay(header, reader)  # Envía el mensaje hacia el nodo destino
+                print(f"Node {self.node_name} routed message to {destination_node_name} via port {channel.port}")
+            except Exception as e:
+                print(f"Error while sending to {destination_node_name} on port {channel.port}: {e}")
         else:
             print(f"No route found to {destination_node_name}")
+            reader.skip(header)
 
 
 # Ejemplo de uso
@@ -143,5 +197,7 @@ if __name__ == "__main__":
     node.start()
 
     while True:
-        node.connect_to_server()
+        node.keep_alive()
+        # Mostrar la ocupación de las colas de entrada y salida
+        print(f"Workers: {node.workers.stats()}, outbound queues: {node.pool.queue_depths()}")
         time.sleep(15)
\ No newline at end of file
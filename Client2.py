@@ -5,8 +5,18 @@ import rsa
 import socket
 import threading
 from Controller1 import network
+from audio_codec import CODECS
+from audio_reassembly import AudioFlows
+from audio_stream import stream_audio_file
+from routing_table import load_routing_tables
+from receive_pipeline import DecryptPool, receive_decrypted
+from session_crypto import SessionEncryptor, SessionKeys
+from wire import MESSAGE_AUDIO, MESSAGE_SESSION, MESSAGE_USER, SESSION_FLAG, encode_message, node_ids
+from worker_pool import WorkerPool
 
 CHUNK = 1024
+# Audio bytes per session-encrypted message
+SESSION_CHUNK = 64 * 1024
 
 file_pri = open('pri_key.txt', 'rb')
 private_key = pickle.load(file_pri)
@@ -31,54 +41,33 @@ def load_port_mapping():
     return port_mapping
 
 
-def send_message(origin_node, destination_node, message, public_key, origin_port, message_type="user_message",  audio_file=None):
+def send_message(origin_node, destination_node, message, public_key, origin_port, message_type="user_message",  audio_file=None, codec="raw"):
     try:
         # Establish connection to the target node
         client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         client_socket.connect(("localhost", origin_port))  # Conectarse al puerto de escucha del nodo
-        with open("routing_tables.json", "r") as file:
-            routing_tables = json.load(file)
-            if origin_node in routing_tables:
-                routing_table_json = routing_tables[origin_node]
-                path = routing_table_json[destination_node]
+        routing_tables = load_routing_tables("routing_tables.json")
+        path = routing_tables.path(origin_node, destination_node)
+        ids = node_ids(load_port_mapping())
 
         # If it is an audio message, attach the file to the message.
         if message_type == "audio_message":
-            # Read audio file and send in chunks
-            with open(audio_file, 'rb') as f:
-                i = 0
-                while i < 10:
-                    i += 1
-                    chunk = f.read(53)
-                    if not chunk:
-                        break
-                    encrypted_chunk = encrypt_message(chunk, public_key)
-                    data = {
-                        "tipo": "audio_message",
-                        "origen": origin_node,
-                        "destino": destination_node,
-                        "mensaje": encrypted_chunk
-                    }
-                    # Establish a new connection to send current chunk
-                    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    client_socket.connect(("localhost", port_mapping))  # Connect to the node listening port
-                    client_socket.sendall(pickle.dumps(data))
-                    client_socket.close()  # Close connection after sending chunk
+            # Encrypt a fresh session key with RSA once; the chunks are encrypted with it
+            session = SessionEncryptor(public_key)
+            # Stream the whole file on this connection, reading, compressing, encrypting and sending in parallel
+            chunks = stream_audio_file(client_socket, audio_file, session, ids[origin_node], ids[destination_node],
+                                       SESSION_CHUNK, codec=CODECS[codec])
+            print(f"Audio file sent in {chunks} chunks.")
 
         if message_type == "user_message":
             # Encrypt message only
             encrypted_message = encrypt_message(message.encode(), public_key)  # Convert to bytes before encryption
 
             # Construct the complete message with the data information
-            data = {
-                "tipo": message_type,
-                "origen": origin_node,
-                "destino": destination_node,
-                "mensaje": encrypted_message
-            }
+            data = encode_message(MESSAGE_USER, ids[origin_node], ids[destination_node], 0, encrypted_message)
 
             # Send complete message to the node
-            client_socket.sendall(pickle.dumps(data))
+            client_socket.sendall(data)
 
         # Close connection
         dijkstra_paths.visualize_path(path, network)
@@ -87,34 +76,45 @@ def send_message(origin_node, destination_node, message, public_key, origin_port
         print(f"Error sending message: {e}")
 
 
-def handle_client(client_socket, private_key):
+def handle_client(client_socket, decryptor, sessions, flows):
     try:
-        audio_chunks = b''
-        # Receive message from node
-        data = pickle.loads(client_socket.recv(1024))
-        message_type = data.get("tipo")
-        message = data.get("mensaje")
-
-        # Decrypt message
-        decrypted_message = decrypt_message(message, private_key)
-
-        # Process  message as required
-        if message_type == "2":
-            print(f"Message received from {data['origen']}: {decrypted_message}")
-            # Process text message as required
-
-        elif message_type == "1":
-            print(f"Audio message received from {data['origen']}")
-            # Concatenate audio packets
-            audio_chunks += decrypted_message
-            print("Audio chunk received.")
+        node_names = {node_id: name for name, node_id in node_ids(load_port_mapping()).items()}
+
+        def drop(header, error):
+            # A message that cannot be decrypted is lost on its own; the connection goes on
+            print(f"Dropping message {header.sequence} from {node_names.get(header.origin)}: {error!r}")
+
+        # Receive messages from node, decrypted in the pool while earlier ones are handled
+        for header, session_id, decrypted_message in receive_decrypted(client_socket, decryptor, sessions, drop):
+            if header.type == MESSAGE_SESSION:
+                # The session key is kept for the messages that follow
+                flows.start_session(session_id)
+                print(f"Session key received from {node_names.get(header.origin)}")
+                continue
+            message_type = header.type & ~SESSION_FLAG
+
+            # Process  message as required
+            if message_type == MESSAGE_USER:
+                print(f"Message received from {node_names.get(header.origin)}: {decrypted_message}")
+                # Process text message as required
+
+            elif message_type == MESSAGE_AUDIO:
+                print(f"Audio message received from {node_names.get(header.origin)}")
+                # Reassemble the decoded audio flow in order into a WAV file, across reconnections of the sender
+                filename = f"received_{node_names.get(header.origin)}_{session_id or 0:08x}.wav"
+                report = flows.add(header.origin, session_id, header.sequence, decrypted_message, filename)
+                if report is not None:
+                    print(f"Audio file received: {report}")
 
-        else:
-            print("Unknown message type")
+            else:
+                print("Unknown message type")
 
     except Exception as e:
         print(f"Error handling client: {e}")
     finally:
+        # Keep whatever arrived of the audio flows no connection has added to for a while
+        for report in flows.close_idle():
+            print(f"Audio file incomplete: {report}")
         # Close connection to the node
         client_socket.close()
 
@@ -126,6 +126,10 @@ def listen_for_messages(private_key):
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.bind(("localhost", 7002))  # Puerto de escucha del cliente
         server_socket.listen(5)
+        workers = WorkerPool(8, 32, name="client")
+        sessions = SessionKeys(private_key)
+        decryptor = DecryptPool(private_key)
+        flows = AudioFlows()
         # print("Client listening for incoming messages...")
 
         while True:
@@ -133,8 +137,8 @@ def listen_for_messages(private_key):
             client_socket, client_address = server_socket.accept()
             print(f"Client accepted connection from {client_address}")
 
-            #Process message as required
-            threading.Thread(target=handle_client, args=(client_socket, private_key)).start()
+            # Process message as required; blocks while all workers are busy and the queue is full
+            workers.submit(handle_client, client_socket, decryptor, sessions, flows)
 
     except KeyboardInterrupt:
         print("Keyboard interrupt received. Closing server socket...")
@@ -168,11 +172,12 @@ def menu():
             origin_node = input("Enter Origin Node (IP): ")
             destination_node = input("Enter Destination Node (IP): ")
             audio_file = input("Enter Audio File Name: ")
+            codec = input("Enter Audio Codec (raw, mulaw or adpcm) [raw]: ") or "raw"
             origin_port = port_mapping.get(origin_node)
             if origin_port is None:
                 print(f"No Port Found for IP Address {origin_node}")
             else:
-                send_message(origin_node, destination_node, audio_file, public_key, origin_port, "audio_message", audio_file)
+                send_message(origin_node, destination_node, audio_file, public_key, origin_port, "audio_message", audio_file, codec)
 
         elif choice == "3":
             print("Exiting the Program...")
@@ -1,10 +1,22 @@
+import asyncio
 import socket
 import threading
 import json
 import networkx as nx
 import rsa
 import pickle
+import dijkstra_paths
+import parallel_routes
+from concurrent.futures import ProcessPoolExecutor
 from network import Network
+from dynamic_spf import DynamicSPF
+from receive_pipeline import DecryptPool
+from routing_table import NextHopTable, TableChangelog, save_routing_tables
+from wire import encode_frame, send_frame
+from timer_wheel import TimerWheel
+
+# Seconds a push may wait for a subscriber to read before it is dropped
+SUBSCRIBER_TIMEOUT = 5
 
 # Cargar claves RSA desde archivos
 with open('pri_key.txt', 'rb') as file_pri:
@@ -55,6 +67,10 @@ network.add_link(11, 13, 1500)
 network.add_link(12, 14, 600)
 network.add_link(13, 14, 300)
 
+# Keep the Dijkstra shortest-path trees up to date as the topology changes
+spf = DynamicSPF(network.graph)
+network.add_listener(spf)
+
 class TCPServer:
     """
     Class to implement a TCP server for routing in a network.
@@ -63,11 +79,20 @@ class TCPServer:
         host (str): The host address for the server.
         port (int): The port number for the server.
         server_socket (socket): The server socket object.
-        node_timers (dict): A dictionary to store node timers.
+        liveness (TimerWheel): The liveness timeouts of the registered nodes.
         algorithm (str): The routing algorithm used by the server.
+        executor (ProcessPoolExecutor): The worker pool of the parallel algorithm, created on first use.
+        routing_tables (NextHopTable): The current routing tables.
+        changelog (TableChangelog): The versions of the routing tables and the changes between them.
+        responses (dict): The encoded full routing table response of each node, built once per version.
+        delta_responses (dict): The encoded changes for each (node, known version), built on first request.
+        tables_lock (Lock): Guards the changelog and the responses, so a response is read together with its version.
+        snapshot_file (str): The file the routing tables are written to in the background, or None.
+        snapshot_pending (NextHopTable): The latest routing tables not yet written, or None.
+        subscribers (dict): The open subscription socket of each node and the table version it holds.
     """
 
-    def __init__(self, host, port, algorithm):
+    def __init__(self, host, port, algorithm, snapshot_file="routing_tables.json"):
         """
         Initializes the TCPServer with given parameters.
 
@@ -75,12 +100,27 @@ class TCPServer:
             host (str): The host address for the server.
             port (int): The port number for the server.
             algorithm (str): The routing algorithm used by the server.
+            snapshot_file (str): The file to snapshot the routing tables to, or None to keep them in memory only.
         """
         self.host = host
         self.port = port
         self.server_socket = None
-        self.node_timers = {}
+        self.liveness = TimerWheel(30, self.remove_nodes)
         self.algorithm = None
+        self.executor = None
+        self.routing_tables = None
+        self.changelog = TableChangelog()
+        self.responses = {}
+        self.delta_responses = {}
+        self.tables_lock = threading.Lock()
+        self.snapshot_file = snapshot_file
+        self.snapshot_pending = None
+        self.snapshot_changed = threading.Condition()
+        self.snapshot_writer = None
+        self.subscribers = {}
+        self.subscribers_lock = threading.Lock()
+        self.compute_lock = threading.Lock()
+        self.recompute_timer = None
 
     def start(self):
         """
@@ -90,7 +130,8 @@ class TCPServer:
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(5)
         print(f"Server listening on {self.host}:{self.port}...")
-        threading.Timer(30, self.update_routing_tables).start()
+        self.compute_routing_tables()
+        self.liveness.start()
         while True:
             try:
                 client_socket, client_address = self.server_socket.accept()
@@ -110,64 +151,256 @@ class TCPServer:
         try:
             encrypted_node_name = client_socket.recv(1024)
             node_name_bytes = rsa.decrypt(encrypted_node_name, private_key)
-            node_name = node_name_bytes.decode()
+            # Nodes that already hold a table append its epoch and version, and
+            # subscribing nodes a mode: "<name>[:<epoch>.<version>[:subscribe]]"
+            node_name, _, request = node_name_bytes.decode().partition(":")
+            known_version, _, mode = request.partition(":")
 
             print(f"Received request from node: {node_name}")
-            if node_name in self.node_timers:
-                self.node_timers[node_name].cancel()
-            self.node_timers[node_name] = threading.Timer(30, self.remove_node, args=(node_name,))
-            self.node_timers[node_name].start()
-            with open("routing_tables.json", "r") as file:
-                routing_tables = json.load(file)
-                if node_name in routing_tables:
-                    routing_table_json = json.dumps(routing_tables[node_name], indent=4)
-                    client_socket.sendall(routing_table_json.encode())
-                    print(f"Routing table sent to {node_name}.")
-                else:
-                    print(f"No routing table found for node {node_name}.")
-                    node_id = node_name[-1]
-                    self.add_node_to_network(node_name, node_id)
+            self.liveness.refresh(node_name)
+            if node_name in self.responses and mode == "subscribe":
+                self.add_subscriber(node_name, client_socket, known_version)
+                self.serve_subscription(node_name, client_socket)
+                client_socket = None
+            elif node_name in self.responses:
+                send_frame(client_socket, self.response_for(node_name, known_version)[0])
+                print(f"Routing table sent to {node_name}.")
+            else:
+                print(f"No routing table found for node {node_name}.")
+                node_id = node_name[-1]
+                self.add_node_to_network(node_name, node_id)
         except Exception as e:
             print(f"Error handling client: {e}")
         finally:
-            client_socket.close()
+            if client_socket is not None:
+                client_socket.close()
+
+    def add_subscriber(self, node_name, client_socket, known_version):
+        """
+        Keeps a node's connection open to push routing table changes to it.
+
+        The current table (or its changes since known_version) is sent first
+        as a length-prefixed frame; publish_routing_tables sends the later ones.
+        A node that stops reading for SUBSCRIBER_TIMEOUT seconds loses its
+        subscription, so it cannot hold up the pushes to the others.
+
+        Args:
+            node_name (str): The name of the subscribing node.
+            client_socket (socket): The connection to keep open.
+            known_version (str): The "<epoch>.<version>" of the table the node holds, or an empty string.
+        """
+        client_socket.settimeout(SUBSCRIBER_TIMEOUT)
+        with self.subscribers_lock:
+            response, version = self.response_for(node_name, known_version)
+            send_frame(client_socket, response)
+            previous = self.subscribers.pop(node_name, None)
+            if previous is not None:
+                self.end_subscription(previous[0])
+            self.subscribers[node_name] = (client_socket, version)
+        print(f"Node {node_name} subscribed to routing table updates.")
+
+    def serve_subscription(self, node_name, client_socket):
+        """
+        Reads the heartbeats of a subscribed node, each of which keeps it
+        alive, until the subscription is closed by either side.
+
+        Args:
+            node_name (str): The name of the subscribed node.
+            client_socket (socket): The subscription connection.
+        """
+        try:
+            while True:
+                try:
+                    heartbeats = client_socket.recv(64)
+                except socket.timeout:
+                    continue
+                if not heartbeats:
+                    break
+                self.liveness.refresh(node_name)
+        except OSError:
+            pass
+        with self.subscribers_lock:
+            if self.subscribers.get(node_name, (None,))[0] is client_socket:
+                del self.subscribers[node_name]
+        client_socket.close()
+
+    @staticmethod
+    def end_subscription(client_socket):
+        """
+        Ends a subscription. Shutting the connection down wakes up its
+        serve_subscription thread, which closes it.
+
+        Args:
+            client_socket (socket): The subscription connection.
+        """
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def publish_routing_tables(self):
+        """
+        Pushes the changes of the current routing tables to every subscriber.
+        """
+        with self.subscribers_lock:
+            for node_name, (subscriber_socket, known_version) in list(self.subscribers.items()):
+                if known_version == self.changelog.version or node_name not in self.responses:
+                    continue
+                try:
+                    response, version = self.response_for(node_name, f"{self.changelog.epoch}.{known_version}")
+                    send_frame(subscriber_socket, response)
+                    self.subscribers[node_name] = (subscriber_socket, version)
+                except OSError as e:
+                    print(f"Dropping subscription of {node_name}: {e}")
+                    self.end_subscription(subscriber_socket)
+                    del self.subscribers[node_name]
+
+    def drop_subscribers(self, node_names):
+        """
+        Closes the subscriptions of the given nodes.
+
+        Args:
+            node_names (list): The names of the nodes.
+        """
+        with self.subscribers_lock:
+            for node_name in node_names:
+                subscription = self.subscribers.pop(node_name, None)
+                if subscription is not None:
+                    self.end_subscription(subscription[0])
 
     def compute_routing_tables(self):
         """
         Computes the routing tables based on the selected routing algorithm.
+
+        The response of every node is encoded once here, so that serving a
+        registration is a dictionary lookup. Changes are pushed to subscribed
+        nodes right away, once the computation lock is released, and the
+        file snapshot is written by a background thread. The next periodic
+        computation is scheduled 30 seconds later.
         """
+        with self.compute_lock:
+            if self.recompute_timer is not None:
+                self.recompute_timer.cancel()
+            changed = self._compute_routing_tables()
+            self.recompute_timer = threading.Timer(30, self.update_routing_tables)
+            self.recompute_timer.start()
+        if changed:
+            self.publish_routing_tables()
+
+    def _compute_routing_tables(self):
         if algorithm == '2':
-            all_paths = dict(nx.all_pairs_dijkstra_path(network.graph))
+            routing_tables = NextHopTable.from_paths(spf.all_paths())
         elif algorithm == '1':
-            all_paths = dict(nx.all_pairs_bellman_ford_path(network.graph))
+            routing_tables = NextHopTable.from_paths(dict(nx.all_pairs_bellman_ford_path(network.graph)))
+        elif algorithm == '3':
+            names, _, predecessors = dijkstra_paths.compute_shortest_paths_floyd_warshall(network)
+            routing_tables = NextHopTable.from_predecessors(names, predecessors)
+        elif algorithm == '4':
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor()
+            names, next_hops = parallel_routes.compute_next_hops_parallel(network, self.executor)
+            routing_tables = NextHopTable(names, next_hops)
         else:
             raise ValueError(
-                "Invalid algorithm specified. Choose dijkstra ('1') or bellman_ford ('2').")
-        routing_tables = {}
-        for node, paths in all_paths.items():
-            routing_tables[node] = {}
-            for destination, path in paths.items():
-                routing_tables[node][destination] = path
-        with open("routing_tables.json", "w") as file:
-            json.dump(routing_tables, file, indent=4)
-        print("Routing tables written to routing_tables.json.")
-        threading.Timer(30, self.update_routing_tables).start()
+                "Invalid algorithm specified. Choose bellman_ford ('1'), dijkstra ('2'), "
+                "floyd_warshall ('3') or parallel dijkstra ('4').")
+        if self.changelog.is_current(routing_tables):
+            return False
+        # Only this method, under the computation lock, updates the changelog,
+        # so the responses can be encoded for the next version before taking
+        # the tables lock, which registrations wait on
+        version, epoch = self.changelog.version + 1, self.changelog.epoch
+        responses = {node: json.dumps(dict(routing_tables.node_entry(node), version=version, epoch=epoch)).encode()
+                     for node in routing_tables.nodes}
+        with self.tables_lock:
+            self.changelog.update(routing_tables)
+            self.routing_tables, self.responses, self.delta_responses = routing_tables, responses, {}
+        print(f"Routing tables updated to version {version}.")
+        if self.snapshot_file is not None:
+            self.save_snapshot(routing_tables)
+        return True
+
+    def response_for(self, node_name, known_version):
+        """
+        Returns the encoded routing table response for a node.
+
+        A version of another epoch, e.g. one held since before the controller
+        restarted, is answered with the full table.
+
+        Args:
+            node_name (str): The name of the requesting node.
+            known_version (str): The "<epoch>.<version>" of the table the node holds, or an empty string.
+
+        Returns:
+            tuple: The response, which is a "not modified" response, the changes since
+            known_version or the full table, and the table version it brings the node to.
+        """
+        epoch, _, known_version = known_version.rpartition(".")
+        with self.tables_lock:
+            version = self.changelog.version
+            if epoch != self.changelog.epoch or not known_version.isdigit():
+                return self.responses[node_name], version
+            known_version = int(known_version)
+            if known_version == version:
+                return json.dumps({"version": version, "epoch": epoch, "status": "not_modified"}).encode(), version
+            key = (node_name, known_version)
+            if key not in self.delta_responses:
+                changes = self.changelog.changes_since(node_name, known_version)
+                if changes is None:
+                    return self.responses[node_name], version
+                self.delta_responses[key] = json.dumps(
+                    {"version": version, "epoch": epoch, "base": known_version, "changes": changes}).encode()
+            return self.delta_responses[key], version
+
+    def save_snapshot(self, routing_tables):
+        """
+        Queues the given routing tables to be written to the snapshot file.
+
+        A single background thread writes the snapshots. Versions queued
+        while it is busy replace each other, so only the latest one is
+        written next and the file never goes back to an older version.
+
+        Args:
+            routing_tables (NextHopTable): The routing tables to write.
+        """
+        with self.snapshot_changed:
+            self.snapshot_pending = routing_tables
+            if self.snapshot_writer is None:
+                self.snapshot_writer = threading.Thread(target=self._write_snapshots, daemon=True)
+                self.snapshot_writer.start()
+            self.snapshot_changed.notify()
+
+    def _write_snapshots(self):
+        while True:
+            with self.snapshot_changed:
+                while self.snapshot_pending is None:
+                    self.snapshot_changed.wait()
+                routing_tables, self.snapshot_pending = self.snapshot_pending, None
+            try:
+                save_routing_tables(routing_tables, self.snapshot_file)
+                print(f"Routing tables written to {self.snapshot_file}.")
+            except Exception as e:
+                print(f"Error writing routing tables snapshot: {e}")
 
     def update_routing_tables(self):
         """
-        Updates the routing tables periodically.
+        Updates the routing tables in a separate thread, periodically and
+        whenever the topology changes.
         """
         threading.Thread(target=self.compute_routing_tables).start()
 
-    def remove_node(self, node_name):
+    def remove_nodes(self, node_names):
         """
-        Removes the specified node from the network topology.
+        Removes the specified nodes from the network topology as one batch,
+        followed by a single routing table update.
 
         Args:
-            node_name (str): The name of the node to be removed.
+            node_names (list): The names of the nodes whose liveness timeout expired.
         """
-        print(f"Removing node {node_name} from topology.")
-        network.remove_node(node_name)
+        print(f"Removing nodes {', '.join(node_names)} from topology.")
+        network.apply_changes([("remove_node", node_name) for node_name in node_names])
+        self.drop_subscribers(node_names)
+        self.update_routing_tables()
 
     def add_node_to_network(self, node_name, node_id):
         """
@@ -180,6 +413,188 @@ class TCPServer:
         print(f"Node {node_name} reconnected. Adding it back to the network.")
         network.add_node(node_id, node_name)
         network.display_network()
+        self.update_routing_tables()
+
+class AsyncTCPServer(TCPServer):
+    """
+    Class to implement the routing controller on a single asyncio event loop.
+
+    Registrations and subscriptions are served by coroutines instead of one
+    thread per connection, and the liveness timer wheel is ticked by the
+    event loop. RSA decryption runs in a pool of processes, since it holds
+    the GIL; node removal and route computation run in the loop's default
+    executor. Each subscriber has its own push task, and one that does not
+    read a push within SUBSCRIBER_TIMEOUT seconds is dropped.
+
+    Attributes:
+        loop (asyncio.AbstractEventLoop): The event loop, set when the server starts.
+        decryptor (receive_pipeline.DecryptPool): The processes decrypting the requests, started with the server.
+        subscribers (dict): The stream writer of each subscribed node and the event that wakes up its push task.
+    """
+
+    def __init__(self, host, port, algorithm, snapshot_file="routing_tables.json"):
+        super().__init__(host, port, algorithm, snapshot_file)
+        self.loop = None
+        self.decryptor = None
+        self.liveness.on_expire = self.expire_nodes
+
+    def start(self):
+        """
+        Runs the server until interrupted.
+        """
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """
+        Computes the first routing tables, then accepts connections and
+        recomputes the tables every 30 seconds.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.decryptor = DecryptPool(private_key)
+        await self.loop.run_in_executor(None, self.compute_routing_tables)
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.loop.call_later(self.liveness.resolution, self.tick_liveness)
+        print(f"Server listening on {self.host}:{self.port} (asyncio)...")
+        async with server:
+            while True:
+                await asyncio.sleep(30)
+                await self.loop.run_in_executor(None, self.compute_routing_tables)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Handles a registration or subscription request.
+
+        Args:
+            reader (asyncio.StreamReader): The stream to read the request from.
+            writer (asyncio.StreamWriter): The stream to answer on.
+        """
+        subscribed = False
+        pusher = None
+        try:
+            encrypted_node_name = await reader.read(1024)
+            node_name_bytes = await asyncio.wrap_future(self.decryptor.submit(encrypted_node_name))
+            node_name, _, request = node_name_bytes.decode().partition(":")
+            known_version, _, mode = request.partition(":")
+
+            print(f"Received request from node: {node_name}")
+            self.liveness.refresh(node_name)
+            if node_name in self.responses and mode == "subscribe":
+                response, version = self.response_for(node_name, known_version)
+                writer.write(encode_frame(response))
+                await asyncio.wait_for(writer.drain(), SUBSCRIBER_TIMEOUT)
+                previous = self.subscribers.get(node_name)
+                if previous is not None:
+                    previous[0].close()
+                changed = asyncio.Event()
+                self.subscribers[node_name] = (writer, changed)
+                subscribed = True
+                pusher = asyncio.ensure_future(self.push_changes(node_name, writer, changed, version))
+                print(f"Node {node_name} subscribed to routing table updates.")
+                # The subscription lasts until the node closes the connection, and its heartbeats keep the node alive
+                while await reader.read(64):
+                    self.liveness.refresh(node_name)
+            elif node_name in self.responses:
+                writer.write(encode_frame(self.response_for(node_name, known_version)[0]))
+                await asyncio.wait_for(writer.drain(), SUBSCRIBER_TIMEOUT)
+                print(f"Routing table sent to {node_name}.")
+            else:
+                print(f"No routing table found for node {node_name}.")
+                node_id = node_name[-1]
+                await self.loop.run_in_executor(None, self.add_node_to_network, node_name, node_id)
+        except Exception as e:
+            print(f"Error handling client: {e}")
+        finally:
+            if pusher is not None:
+                pusher.cancel()
+            if subscribed and self.subscribers.get(node_name, (None,))[0] is writer:
+                del self.subscribers[node_name]
+            writer.close()
+
+    async def push_changes(self, node_name, writer, changed, version):
+        """
+        Pushes the changes of the routing tables to one subscriber each time
+        changed is set. Changes computed while a push is being sent are
+        merged into the next one. A subscriber that does not read a push
+        within SUBSCRIBER_TIMEOUT seconds is disconnected, which ends its
+        subscription.
+
+        Args:
+            node_name (str): The name of the subscribed node.
+            writer (asyncio.StreamWriter): The subscription stream.
+            changed (asyncio.Event): Set when new routing tables are computed.
+            version (int): The table version the node holds.
+        """
+        while True:
+            await changed.wait()
+            changed.clear()
+            if version == self.changelog.version or node_name not in self.responses:
+                continue
+            response, version = self.response_for(node_name, f"{self.changelog.epoch}.{version}")
+            writer.write(encode_frame(response))
+            try:
+                await asyncio.wait_for(writer.drain(), SUBSCRIBER_TIMEOUT)
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                reason = e if isinstance(e, ConnectionError) else f"push not read within {SUBSCRIBER_TIMEOUT} seconds"
+                print(f"Dropping subscription of {node_name}: {reason}")
+                # Discard the unsent data; the subscription ends when its reader sees the connection closed
+                writer.transport.abort()
+                return
+
+    def tick_liveness(self):
+        """
+        Advances the liveness timer wheel from the event loop.
+        """
+        self.loop.call_later(self.liveness.resolution, self.tick_liveness)
+        self.liveness.tick()
+
+    def expire_nodes(self, node_names):
+        """
+        Liveness timer wheel callback: removes the expired nodes in the executor.
+        """
+        self.loop.run_in_executor(None, self.remove_nodes, node_names)
+
+    def compute_routing_tables(self):
+        """
+        Computes the routing tables; runs in the executor.
+        """
+        with self.compute_lock:
+            changed = self._compute_routing_tables()
+        if changed:
+            self.publish_routing_tables()
+
+    def update_routing_tables(self):
+        """
+        Schedules a computation of the routing tables in the executor.
+        """
+        self.loop.call_soon_threadsafe(self.loop.run_in_executor, None, self.compute_routing_tables)
+
+    def publish_routing_tables(self):
+        """
+        Schedules pushing the new routing tables to the subscribers on the event loop.
+        """
+        self.loop.call_soon_threadsafe(self.push_routing_tables)
+
+    def drop_subscribers(self, node_names):
+        """
+        Schedules closing the subscriptions of the given nodes on the event loop.
+        """
+        self.loop.call_soon_threadsafe(self.close_subscriptions, node_names)
+
+    def close_subscriptions(self, node_names):
+        """
+        Closes the subscriptions of the given nodes.
+        """
+        for node_name in node_names:
+            subscription = self.subscribers.pop(node_name, None)
+            if subscription is not None:
+                subscription[0].close()
+
+    def push_routing_tables(self):
+        """
+        Wakes up the push task of every subscriber.
+        """
+        for writer, changed in self.subscribers.values():
+            changed.set()
 
 def menu():
     """
@@ -191,6 +606,8 @@ def menu():
     print("=== INITIALIZATION ====")
     print("  1. Bellman-Ford")
     print("  2. Dijkstra")
+    print("  3. Floyd-Warshall")
+    print("  4. Parallel Dijkstra")
     while True:
         try:
             choice = int(input("Enter an option to adjust your algorithm: "))
@@ -198,13 +615,39 @@ def menu():
                 return "1"
             elif choice == 2:
                 return "2"
+            elif choice == 3:
+                return "3"
+            elif choice == 4:
+                return "4"
             else:
-                print("Invalid option. Please enter 1 or 2.")
+                print("Invalid option. Please enter a number from 1 to 4.")
+        except ValueError:
+            print("Invalid input. Please enter a number from 1 to 4.")
+
+def server_menu():
+    """
+    Displays the menu for selecting how the server handles connections.
+
+    Returns:
+        str: The selected server mode.
+    """
+    print("=== SERVER MODE ====")
+    print("  1. Threaded")
+    print("  2. Asyncio")
+    while True:
+        try:
+            choice = int(input("Enter an option to adjust your server: "))
+            if choice in (1, 2):
+                return str(choice)
+            print("Invalid option. Please enter 1 or 2.")
         except ValueError:
             print("Invalid input. Please enter a number (1 or 2).")
 
 # Example usage
 if __name__ == "__main__":
     algorithm = menu()
-    server = TCPServer("localhost", 1000, algorithm)
+    if server_menu() == "2":
+        server = AsyncTCPServer("localhost", 1000, algorithm)
+    else:
+        server = TCPServer("localhost", 1000, algorithm)
     server.start()
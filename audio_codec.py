@@ -0,0 +1,263 @@
+import struct
+import numpy as np
+from audio_reassembly import parse_wav_header, wav_chunks
+
+# Every audio chunk starts with its codec, the number of channels and the number of sample frames
+CHUNK_HEADER = struct.Struct("!BBI")
+RAW = 0
+MULAW = 1
+ADPCM = 2
+CODECS = {"raw": RAW, "mulaw": MULAW, "adpcm": ADPCM}
+
+# G.711 mu-law
+MULAW_BIAS = 0x84
+MULAW_CLIP = 32635
+
+# IMA-ADPCM step sizes and step index changes by code
+ADPCM_STEPS = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97,
+    107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+    876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428,
+    4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350,
+    22385, 24623, 27086, 29794, 32767], dtype=np.int32)
+ADPCM_INDEX_CHANGES = np.array([-1, -1, -1, -1, 2, 4, 6, 8] * 2, dtype=np.int32)
+# Samples per channel coded from one starting predictor and step index
+ADPCM_BLOCK = 256
+
+
+def _mulaw_encode(samples):
+    x = samples.astype(np.int32)
+    sign = (x < 0).astype(np.int32) << 7
+    magnitude = np.minimum(np.abs(x), MULAW_CLIP) + MULAW_BIAS
+    # Position of the highest set bit, from bit 7
+    exponent = np.frexp(magnitude)[1].astype(np.int32) - 8
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+def _mulaw_decode(codes):
+    code = ~codes.astype(np.int32) & 0xFF
+    exponent = (code >> 4) & 0x07
+    magnitude = ((((code & 0x0F) << 3) + MULAW_BIAS) << exponent) - MULAW_BIAS
+    return np.where(code & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+# Every 16-bit sample and every code, converted once
+_MULAW_ENCODED = _mulaw_encode(np.arange(-32768, 32768))
+_MULAW_DECODED = _mulaw_decode(np.arange(256))
+
+
+def mulaw_encode(samples):
+    """
+    Compresses 16-bit samples to 8-bit G.711 mu-law codes.
+
+    Parameters:
+    samples (numpy.ndarray): Samples of dtype int16.
+
+    Returns:
+    numpy.ndarray: One uint8 code per sample.
+    """
+    return _MULAW_ENCODED[samples.astype(np.int32) + 32768]
+
+
+def mulaw_decode(codes):
+    """
+    Expands G.711 mu-law codes to 16-bit samples.
+
+    Parameters:
+    codes (numpy.ndarray): Codes of dtype uint8.
+
+    Returns:
+    numpy.ndarray: One int16 sample per code.
+    """
+    return _MULAW_DECODED[codes]
+
+
+def _adpcm_step(step, code):
+    # Difference added to the predictor by a code, the same for the encoder and the decoder
+    difference = step >> 3
+    difference += np.where(code & 4, step, 0)
+    difference += np.where(code & 2, step >> 1, 0)
+    difference += np.where(code & 1, step >> 2, 0)
+    return np.where(code & 8, -difference, difference)
+
+
+def adpcm_encode(streams):
+    """
+    Compresses 16-bit sample streams to 4-bit IMA-ADPCM codes.
+
+    The coder is sequential along a stream, since each code depends on the
+    predictor and step left by the previous one, so the streams are
+    coded side by side: each step handles one sample of every stream as a
+    single vector operation.
+
+    Parameters:
+    streams (numpy.ndarray): Samples of dtype int16, one stream per row.
+
+    Returns:
+    tuple: The starting predictor (int16) and step index (uint8) of each stream, and the
+    uint8 codes, one per sample, with the same shape as streams.
+    """
+    samples = streams.astype(np.int32)
+    predictor = samples[:, 0].copy()
+    # Start from the step closest to the first change
+    first_change = np.abs(samples[:, 1] - samples[:, 0]) if samples.shape[1] > 1 else np.zeros_like(predictor)
+    index = np.minimum(np.searchsorted(ADPCM_STEPS, first_change), len(ADPCM_STEPS) - 1).astype(np.int32)
+    start = (predictor.astype(np.int16), index.astype(np.uint8))
+    codes = np.empty(samples.shape, dtype=np.uint8)
+    for position in range(samples.shape[1]):
+        step = ADPCM_STEPS[index]
+        difference = samples[:, position] - predictor
+        code = np.where(difference < 0, 8, 0)
+        difference = np.abs(difference)
+        for bit, threshold in ((4, step), (2, step >> 1), (1, step >> 2)):
+            over = difference >= threshold
+            code |= np.where(over, bit, 0)
+            difference -= np.where(over, threshold, 0)
+        predictor = np.clip(predictor + _adpcm_step(step, code), -32768, 32767)
+        index = np.clip(index + ADPCM_INDEX_CHANGES[code], 0, len(ADPCM_STEPS) - 1)
+        codes[:, position] = code
+    return start, codes
+
+
+def adpcm_decode(predictor, index, codes):
+    """
+    Expands IMA-ADPCM code streams to 16-bit samples.
+
+    Parameters:
+    predictor (numpy.ndarray): Starting predictor of each stream.
+    index (numpy.ndarray): Starting step index of each stream.
+    codes (numpy.ndarray): uint8 codes, one stream per row.
+
+    Returns:
+    numpy.ndarray: The int16 samples, with the same shape as codes.
+    """
+    predictor = predictor.astype(np.int32)
+    index = index.astype(np.int32)
+    samples = np.empty(codes.shape, dtype=np.int16)
+    for position in range(codes.shape[1]):
+        code = codes[:, position].astype(np.int32)
+        predictor = np.clip(predictor + _adpcm_step(ADPCM_STEPS[index], code), -32768, 32767)
+        index = np.clip(index + ADPCM_INDEX_CHANGES[code], 0, len(ADPCM_STEPS) - 1)
+        samples[:, position] = predictor
+    return samples
+
+
+def encode_chunk(data, codec=RAW, channels=1):
+    """
+    Encodes a chunk of audio for sending.
+
+    Parameters:
+    data (bytes): Little-endian 16-bit PCM frames, or any bytes for RAW.
+    codec (int): RAW, MULAW or ADPCM.
+    channels (int): Interleaved channels in data.
+
+    Returns:
+    bytes: The chunk header followed by the encoded data.
+    """
+    if codec == RAW:
+        return CHUNK_HEADER.pack(RAW, 0, len(data)) + bytes(data)
+    samples = np.frombuffer(data, dtype="<i2")
+    frames = len(samples) // channels
+    if codec == MULAW:
+        return CHUNK_HEADER.pack(MULAW, channels, frames) + mulaw_encode(samples).tobytes()
+    if codec != ADPCM:
+        raise ValueError(f"Unknown audio codec: {codec}")
+    # Cut each channel into blocks, repeating the last frame to fill the final one
+    blocks = -(-frames // ADPCM_BLOCK)
+    samples = samples.reshape(frames, channels)
+    samples = np.pad(samples, ((0, blocks * ADPCM_BLOCK - frames), (0, 0)), mode="edge")
+    streams = samples.reshape(blocks, ADPCM_BLOCK, channels).transpose(0, 2, 1).reshape(-1, ADPCM_BLOCK)
+    (predictor, index), codes = adpcm_encode(streams)
+    packed = codes[:, 0::2] | (codes[:, 1::2] << 4)
+    return (CHUNK_HEADER.pack(ADPCM, channels, frames) + predictor.astype("<i2").tobytes() +
+            index.tobytes() + packed.tobytes())
+
+
+def decode_chunk(chunk):
+    """
+    Decodes a chunk made by encode_chunk.
+
+    Parameters:
+    chunk (bytes): The chunk header followed by the encoded data.
+
+    Returns:
+    bytes: The original data, or for a lossy codec, PCM frames of the same length.
+    """
+    codec, channels, frames = CHUNK_HEADER.unpack_from(chunk)
+    body = memoryview(chunk)[CHUNK_HEADER.size:]
+    if codec == RAW:
+        return bytes(body)
+    if codec == MULAW:
+        return mulaw_decode(np.frombuffer(body, dtype=np.uint8)).astype("<i2").tobytes()
+    if codec != ADPCM:
+        raise ValueError(f"Unknown audio codec: {codec}")
+    blocks = -(-frames // ADPCM_BLOCK)
+    streams = blocks * channels
+    predictor = np.frombuffer(body, dtype="<i2", count=streams)
+    index = np.frombuffer(body, dtype=np.uint8, count=streams, offset=2 * streams)
+    packed = np.frombuffer(body, dtype=np.uint8, offset=3 * streams).reshape(streams, ADPCM_BLOCK // 2)
+    codes = np.empty((streams, ADPCM_BLOCK), dtype=np.uint8)
+    codes[:, 0::2] = packed & 0x0F
+    codes[:, 1::2] = packed >> 4
+    samples = adpcm_decode(predictor, index, codes)
+    samples = samples.reshape(blocks, channels, ADPCM_BLOCK).transpose(0, 2, 1).reshape(-1, channels)
+    return samples[:frames].astype("<i2").tobytes()
+
+
+def pcm_format(data):
+    """
+    Finds the channels of a 16-bit PCM WAV file from its first bytes.
+
+    Parameters:
+    data (bytes): The start of the file.
+
+    Returns:
+    int: The number of channels, or None if the file is not 16-bit PCM.
+    """
+    for name, offset, length in wav_chunks(data):
+        if name == b"fmt " and length >= 16 and offset + 16 <= len(data):
+            format_tag, channels, _, _, _, bits = struct.unpack_from("<HHIIHH", data, offset)
+            if format_tag == 1 and bits == 16 and channels:
+                return channels
+            return None
+    return None
+
+
+def audio_chunks(data, chunk_size, codec=RAW):
+    """
+    Cuts a WAV file into encoded chunks.
+
+    Only the samples are compressed: the header, and any chunk following
+    the sample data, are sent unchanged so the file received keeps all its
+    metadata. Each chunk decodes on its own to at most chunk_size bytes,
+    whatever arrives before it. Files that are not 16-bit PCM are sent raw.
+
+    Parameters:
+    data (bytes or mmap.mmap): The whole file.
+    chunk_size (int): File bytes per chunk.
+    codec (int): RAW, MULAW or ADPCM.
+
+    Yields:
+    bytes: The encoded chunks, in file order.
+    """
+    head = data[:chunk_size]
+    layout = parse_wav_header(head)
+    channels = pcm_format(head) if layout is not None else None
+    if codec == RAW or channels is None:
+        layout = (len(data), len(data), 0)
+    _, start, length = layout
+    end = min(start + length, len(data))
+    frame = 2 * channels if channels else 1
+    samples_size = max(chunk_size - chunk_size % frame, frame)
+    for offset in range(0, start, chunk_size):
+        yield encode_chunk(data[offset:min(offset + chunk_size, start)])
+    for offset in range(start, end, samples_size):
+        samples = data[offset:min(offset + samples_size, end)]
+        # A truncated last frame is sent as it is
+        whole = len(samples) - len(samples) % frame
+        yield encode_chunk(samples[:whole], codec, channels)
+        if whole < len(samples):
+            yield encode_chunk(samples[whole:])
+    for offset in range(end, len(data), chunk_size):
+        yield encode_chunk(data[offset:offset + chunk_size])
@@ -0,0 +1,283 @@
+import mmap
+import struct
+import threading
+import time
+
+RIFF_HEADER = struct.Struct("<4sI4s")
+CHUNK_HEADER = struct.Struct("<4sI")
+
+
+def wav_chunks(data):
+    """
+    Lists the chunks of a WAV file found in its first bytes.
+
+    Parameters:
+    data (bytes): The start of the file.
+
+    Returns:
+    list: (name, offset of the chunk body, length of the chunk body) of each chunk whose header
+    lies within data; empty if data does not start with a RIFF/WAVE header.
+    """
+    if len(data) < RIFF_HEADER.size:
+        return []
+    riff, _, wave = RIFF_HEADER.unpack_from(data)
+    if riff != b"RIFF" or wave != b"WAVE":
+        return []
+    chunks = []
+    offset = RIFF_HEADER.size
+    while offset + CHUNK_HEADER.size <= len(data):
+        name, length = CHUNK_HEADER.unpack_from(data, offset)
+        offset += CHUNK_HEADER.size
+        chunks.append((name, offset, length))
+        # Chunks are padded to an even length
+        offset += length + (length & 1)
+    return chunks
+
+
+def parse_wav_header(data):
+    """
+    Finds the layout of a WAV file from its first bytes.
+
+    Parameters:
+    data (bytes): The start of the file.
+
+    Returns:
+    tuple: (file length, offset of the sample data, length of the sample data) as given by the
+    header, or None if data does not start with a RIFF/WAVE header reaching the data chunk.
+    """
+    for name, offset, length in wav_chunks(data):
+        if name == b"data":
+            return RIFF_HEADER.unpack_from(data)[1] + 8, offset, length
+    return None
+
+
+class AudioReassembly:
+    """
+    Reassembles one audio flow into a WAV file as its chunks arrive.
+
+    Chunks are numbered from 1 by the sender. Chunks arriving ahead of the
+    next expected one wait in a bounded jitter buffer; once it holds
+    window chunks, the missing one is given up as lost and replaced by
+    silence of one chunk, so later data keeps its offset. In-order data is
+    copied straight into the output file, memory-mapped and preallocated
+    to the length announced by the WAV header of the first chunk, which
+    also tells when the flow is complete.
+
+    Attributes:
+    filename (str): Path of the output file.
+    window (int): Most chunks held in the jitter buffer.
+    next_sequence (int): Sequence number of the next chunk to write.
+    expected_size (int): File length announced by the WAV header, or None until known.
+    size (int): Bytes written so far.
+    gaps (list): Sequence numbers of the chunks given up as lost.
+    duplicates (int): Chunks received again after being written or given up.
+    started (float): time.monotonic() of the start of the flow.
+    first_byte (float): time.monotonic() of the first write, or None.
+    completed (float): time.monotonic() of the close, or None.
+    """
+
+    def __init__(self, filename, window=32, started=None, initial_size=1024 * 1024):
+        """
+        Creates the output file.
+
+        Parameters:
+        filename (str): Path of the output file.
+        window (int): Most chunks held in the jitter buffer.
+        started (float): time.monotonic() of the start of the flow, such as the arrival of its session key
+            (default is now).
+        initial_size (int): Preallocated length until the WAV header is known.
+        """
+        self.filename = filename
+        self.window = window
+        self.next_sequence = 1
+        self.pending = {}
+        self.chunk_size = 0
+        self.expected_size = None
+        self.data_offset = None
+        self.size = 0
+        self.gaps = []
+        self.duplicates = 0
+        self.started = time.monotonic() if started is None else started
+        self.first_byte = None
+        self.completed = None
+        self.file = open(filename, "w+b")
+        self.buffer = None
+        self._allocate(initial_size)
+
+    def _allocate(self, size):
+        if self.buffer is not None:
+            self.buffer.close()
+        self.file.truncate(size)
+        self.buffer = mmap.mmap(self.file.fileno(), size)
+
+    def _write(self, data):
+        end = self.size + len(data)
+        if end > len(self.buffer):
+            self._allocate(max(end, 2 * len(self.buffer)))
+        self.buffer[self.size:end] = data
+        if self.first_byte is None:
+            self.first_byte = time.monotonic()
+        if self.size == 0:
+            layout = parse_wav_header(data)
+            if layout is not None:
+                self.expected_size, self.data_offset, _ = layout
+                if self.expected_size > len(self.buffer):
+                    self._allocate(self.expected_size)
+        self.size = end
+
+    @property
+    def complete(self):
+        """
+        Whether the whole file announced by the WAV header has been written.
+        """
+        return self.expected_size is not None and self.size >= self.expected_size
+
+    def add(self, sequence, data):
+        """
+        Adds a received chunk to the flow.
+
+        Parameters:
+        sequence (int): Sequence number of the chunk.
+        data (bytes): Decrypted audio bytes.
+        """
+        if sequence < self.next_sequence or sequence in self.pending:
+            self.duplicates += 1
+            return
+        self.chunk_size = max(self.chunk_size, len(data))
+        self.pending[sequence] = data
+        self._flush(force=False)
+
+    def _flush(self, force):
+        """
+        Writes the buffered chunks that are next in order. A missing chunk is
+        given up when the jitter buffer is full, or always if force is set.
+        """
+        while self.pending:
+            data = self.pending.pop(self.next_sequence, None)
+            if data is None:
+                if not force and len(self.pending) < self.window:
+                    break
+                # Replace the missing chunk by silence to keep the offsets of the next ones
+                self.gaps.append(self.next_sequence)
+                data = bytes(self.chunk_size)
+            self._write(data)
+            self.next_sequence += 1
+
+    def close(self):
+        """
+        Writes out the chunks still buffered, giving up on the missing ones,
+        trims the file to the data written and closes it.
+
+        Returns:
+        dict: The reassembly report (see report).
+        """
+        if self.completed is not None:
+            return self.report()
+        self._flush(force=True)
+        if self.expected_size is not None:
+            self.size = min(self.size, self.expected_size)
+            if self.size < self.expected_size and self.size >= self.data_offset:
+                # The flow ended early: make the header describe the data received
+                struct.pack_into("<I", self.buffer, 4, self.size - 8)
+                struct.pack_into("<I", self.buffer, self.data_offset - 4, self.size - self.data_offset)
+        self.buffer.flush()
+        self.buffer.close()
+        self.buffer = None
+        self.file.truncate(self.size)
+        self.file.close()
+        self.completed = time.monotonic()
+        return self.report()
+
+    def report(self):
+        """
+        Returns the reassembly statistics.
+
+        Returns:
+        dict: Bytes written and expected, given-up and duplicate chunks, and the time to first
+        byte and completion latency in seconds from the start of the flow (None until reached).
+        """
+        return {"file": self.filename, "bytes": self.size, "expected_bytes": self.expected_size,
+                "gaps": list(self.gaps), "duplicates": self.duplicates,
+                "time_to_first_byte": None if self.first_byte is None else self.first_byte - self.started,
+                "completion_latency": None if self.completed is None else self.completed - self.started}
+
+
+class AudioFlows:
+    """
+    The audio flows being reassembled by a receiver, shared by all of its
+    connections.
+
+    Flows are keyed by origin and session rather than by connection, so a
+    flow whose sender reconnects in the middle of a transfer goes on
+    writing the same file. A flow that receives nothing for idle_timeout
+    seconds is only closed, with whatever arrived, by close_idle.
+
+    Attributes:
+    idle_timeout (float): Seconds without chunks after which close_idle closes a flow.
+    """
+
+    def __init__(self, idle_timeout=60.0):
+        """
+        Creates an empty set of flows.
+
+        Parameters:
+        idle_timeout (float): Seconds without chunks after which close_idle closes a flow.
+        """
+        self.idle_timeout = idle_timeout
+        # Flow and time of its last chunk, by (origin, session id)
+        self.flows = {}
+        # Arrival time of the session keys not yet used by a flow
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def start_session(self, session_id):
+        """
+        Records the arrival of a session key, which starts the flow sent in that session.
+
+        Parameters:
+        session_id (int): Session id of the key.
+        """
+        with self.lock:
+            self.sessions[session_id] = time.monotonic()
+
+    def add(self, origin, session_id, sequence, data, filename):
+        """
+        Adds a received chunk to its flow, starting the flow if needed.
+
+        Parameters:
+        origin (int): Node id of the sender.
+        session_id (int): Session id of the chunk, or None.
+        sequence (int): Sequence number of the chunk.
+        data (bytes): Decrypted audio bytes.
+        filename (str): Path of the output file, used if the chunk starts a flow.
+
+        Returns:
+        dict: The reassembly report of the flow if the chunk completed it, or None.
+        """
+        key = (origin, session_id)
+        with self.lock:
+            entry = self.flows.get(key)
+            flow = entry[0] if entry else AudioReassembly(filename, started=self.sessions.pop(session_id, None))
+            flow.add(sequence, data)
+            if flow.complete:
+                self.flows.pop(key, None)
+                return flow.close()
+            self.flows[key] = (flow, time.monotonic())
+            return None
+
+    def close_idle(self, idle_timeout=None):
+        """
+        Closes the flows that received nothing for idle_timeout seconds, and
+        forgets the session keys unused for as long.
+
+        Parameters:
+        idle_timeout (float): Seconds without chunks (default is the idle_timeout attribute); 0 closes every flow.
+
+        Returns:
+        list: The reassembly reports of the closed flows.
+        """
+        deadline = time.monotonic() - (self.idle_timeout if idle_timeout is None else idle_timeout)
+        with self.lock:
+            idle = [key for key, (_, last) in self.flows.items() if last <= deadline]
+            self.sessions = {session_id: started for session_id, started in self.sessions.items() if started > deadline}
+            return [self.flows.pop(key)[0].close() for key in idle]
@@ -0,0 +1,92 @@
+import mmap
+import os
+import queue
+import threading
+from audio_codec import RAW, audio_chunks
+from wire import MESSAGE_AUDIO, MESSAGE_SESSION, SESSION_FLAG, encode_header, encode_message, send_buffers
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+def stream_audio_file(sock, audio_file, session, origin, destination, chunk_size=64 * 1024, depth=8, codec=RAW):
+    """
+    Sends a whole file as a stream of session-encrypted audio messages on
+    one connection.
+
+    Three stages overlap, connected by bounded queues: a thread slices
+    the memory-mapped file into chunks and compresses their samples with
+    the codec, a second one encrypts them, and the
+    calling thread sends each header and payload with one gathering write.
+    When the connection is slower than reading and encrypting, the queues
+    fill up and the first two stages wait, so at most about 2 * depth
+    chunks are held in memory. Messages are numbered from 1 in file order,
+    after the session handshake, which is sent first with sequence 0.
+
+    Parameters:
+    sock (socket.socket): Connection to the origin node.
+    audio_file (str): Path of the file to send.
+    session (session_crypto.SessionEncryptor): Session the chunks are encrypted with.
+    origin (int): Id of the origin node.
+    destination (int): Id of the destination node.
+    chunk_size (int): File bytes per message.
+    depth (int): Capacity of each queue between stages.
+    codec (int): Codec of the samples (see audio_codec); the header is always sent unchanged.
+
+    Returns:
+    int: Number of audio messages sent.
+    """
+    chunks = queue.Queue(depth)
+    messages = queue.Queue(depth)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            if os.path.getsize(audio_file):
+                with open(audio_file, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for chunk in audio_chunks(data, chunk_size, codec):
+                        if stop.is_set():
+                            break
+                        chunks.put(chunk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunks.put(_DONE)
+
+    def encrypt():
+        sequence = 1
+        try:
+            while (chunk := chunks.get()) is not _DONE:
+                if stop.is_set():
+                    continue
+                payload = session.encrypt(chunk)
+                messages.put((encode_header(MESSAGE_AUDIO | SESSION_FLAG, origin, destination, sequence, len(payload)), payload))
+                sequence += 1
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+            # Let the reader finish
+            while chunk is not _DONE:
+                chunk = chunks.get()
+        finally:
+            messages.put(_DONE)
+
+    threading.Thread(target=read, daemon=True).start()
+    threading.Thread(target=encrypt, daemon=True).start()
+    sent = 0
+    message = None
+    try:
+        sock.sendall(encode_message(MESSAGE_SESSION, origin, destination, 0, session.handshake))
+        while (message := messages.get()) is not _DONE:
+            send_buffers(sock, message)
+            sent += 1
+    finally:
+        if message is not _DONE:
+            # Sending failed: stop the other stages and wait for them to finish
+            stop.set()
+            while messages.get() is not _DONE:
+                pass
+    if errors:
+        raise errors[0]
+    return sent
@@ -0,0 +1,334 @@
+import sys
+from array import array
+import networkx as nx
+import numpy as np
+from node import Node
+from link import Link
+
+class CompactNetwork:
+    """
+    A class to represent a large network in compact, array-backed form.
+
+    Nodes are interned as consecutive integer ids and links are kept in
+    parallel typed arrays (source id, destination id, bandwidth, weight)
+    instead of per-object dictionaries. Node and Link objects are only
+    created as views when the nodes or links attributes are read, and the
+    CSR adjacency and networkx graph are built lazily when first needed
+    after a change. The graph is a snapshot, replaced after every change:
+    code that keeps a reference to it, such as DynamicSPF, needs a Network
+    instead. Otherwise the public API matches Network.
+
+    Attributes:
+    -----------
+    node_keys : list
+        The node_id given to add_node for each internal id.
+    node_names : list
+        The interned name of each internal id.
+    node_types : list
+        The node type of each internal id.
+    link_sources, link_destinations : array.array
+        The internal ids of the endpoints of each link.
+    link_bandwidths, link_weights : array.array
+        The bandwidth (Gbps) and routing weight (1 / bandwidth) of each link.
+    incident_links : list
+        The indexes of the links of each internal id, including removed ones.
+    graph : networkx.Graph
+        A snapshot of the live topology, built on first use after a change.
+    listeners : list
+        Objects notified of every topology change (see Network.add_listener).
+
+    Methods:
+    --------
+    add_listener(listener), add_node(node_id, name, node_type='router'),
+    add_link(source_id, destination_id, bandwidth), remove_node(node_name),
+    remove_link(source_id, destination_id), apply_changes(changes),
+    display_network():
+        Same behaviour as the corresponding Network methods.
+
+    link_arrays():
+        Returns NumPy copies of the live link arrays.
+
+    csr():
+        Returns the CSR adjacency of the live topology.
+    """
+
+    def __init__(self):
+        """
+        Initializes the CompactNetwork object with empty nodes and links.
+        """
+        self.node_keys = []
+        self.node_names = []
+        self.node_types = []
+        self.node_alive = array('b')
+        self.ids = {}
+        self.name_ids = {}
+        self.link_sources = array('i')
+        self.link_destinations = array('i')
+        self.link_bandwidths = array('d')
+        self.link_weights = array('d')
+        self.link_alive = array('b')
+        self.incident_links = []
+        self.listeners = []
+        self._csr = None
+        self._graph = None
+
+    def _changed(self):
+        self._csr = None
+        self._graph = None
+
+    def add_listener(self, listener):
+        """
+        Registers an object to be notified of topology changes.
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, event, *args):
+        for listener in self.listeners:
+            getattr(listener, event)(*args)
+
+    def _add_node(self, node_id, name, node_type):
+        if node_id in self.ids:
+            return None
+        name = sys.intern(name)
+        internal_id = len(self.node_names)
+        self.ids[node_id] = internal_id
+        self.name_ids[name] = internal_id
+        self.node_keys.append(node_id)
+        self.node_names.append(name)
+        self.node_types.append(node_type)
+        self.node_alive.append(1)
+        self.incident_links.append(array('i'))
+        self._changed()
+        return ('node_added', name)
+
+    def _add_link(self, source_id, destination_id, bandwidth):
+        if source_id not in self.ids or destination_id not in self.ids:
+            print(f"Error: Nodes {source_id} and/or {destination_id} not found in the network")
+            return None
+        source, destination = self.ids[source_id], self.ids[destination_id]
+        self.incident_links[source].append(len(self.link_sources))
+        if destination != source:
+            self.incident_links[destination].append(len(self.link_sources))
+        self.link_sources.append(source)
+        self.link_destinations.append(destination)
+        self.link_bandwidths.append(bandwidth)
+        self.link_weights.append(1/bandwidth)
+        self.link_alive.append(1)
+        self._changed()
+        return ('link_added', self.node_names[source], self.node_names[destination], 1/bandwidth)
+
+    def _remove_node(self, node_name):
+        internal_id = self.name_ids.pop(node_name, None)
+        if internal_id is None:
+            print(f"Error: Node with name {node_name} not found")
+            return None
+        del self.ids[self.node_keys[internal_id]]
+        self.node_alive[internal_id] = 0
+        for link in self.incident_links[internal_id]:
+            self.link_alive[link] = 0
+        self.incident_links[internal_id] = array('i')
+        self._changed()
+        return ('node_removed', node_name)
+
+    def _remove_link(self, source_id, destination_id):
+        if source_id not in self.ids or destination_id not in self.ids:
+            print("Error: Source or destination node not found")
+            return None
+        source, destination = self.ids[source_id], self.ids[destination_id]
+        # Only the links of the endpoint with fewer links are looked at
+        endpoint = min(source, destination, key=lambda node: len(self.incident_links[node]))
+        for link in self.incident_links[endpoint]:
+            if {self.link_sources[link], self.link_destinations[link]} == {source, destination}:
+                self.link_alive[link] = 0
+        # Drop the removed links from the index of both endpoints
+        for node in {source, destination}:
+            self.incident_links[node] = array('i', (link for link in self.incident_links[node]
+                                                    if self.link_alive[link]))
+        self._changed()
+        return ('link_removed', self.node_names[source], self.node_names[destination])
+
+    def add_node(self, node_id, name, node_type='router'):
+        """
+        Adds a node to the network.
+
+        Parameters:
+        -----------
+        node_id : str
+            The unique identifier for the node.
+        name : str
+            The name of the node.
+        node_type : str, optional
+            The type of the node (default is 'router').
+        """
+        event = self._add_node(node_id, name, node_type)
+        if event:
+            self._notify(*event)
+
+    def add_link(self, source_id, destination_id, bandwidth):
+        """
+        Adds a link between two nodes in the network.
+
+        Parameters:
+        -----------
+        source_id : str
+            The unique identifier for the source node.
+        destination_id : str
+            The unique identifier for the destination node.
+        bandwidth : float
+            The bandwidth of the link in Gbps.
+        """
+        event = self._add_link(source_id, destination_id, bandwidth)
+        if event:
+            self._notify(*event)
+
+    def remove_node(self, node_name):
+        """
+        Removes a node and its associated links from the network.
+
+        Parameters:
+        -----------
+        node_name : str
+            The name of the node to be removed.
+        """
+        event = self._remove_node(node_name)
+        if event:
+            self._notify(*event)
+
+    def remove_link(self, source_id, destination_id):
+        """
+        Removes a link between two nodes in the network.
+
+        Parameters:
+        -----------
+        source_id : str
+            The unique identifier for the source node.
+        destination_id : str
+            The unique identifier for the destination node.
+        """
+        event = self._remove_link(source_id, destination_id)
+        if event:
+            self._notify(*event)
+
+    def apply_changes(self, changes):
+        """
+        Applies a batch of topology changes in one transaction.
+
+        Every change is applied to the arrays first, then the listeners are
+        notified of every change that took effect, with the network already
+        in its final state.
+
+        Parameters:
+        -----------
+        changes : list
+            Tuples in the forms accepted by Network.apply_changes.
+        """
+        operations = {'add_node': self._add_node, 'add_link': self._add_link,
+                      'remove_node': self._remove_node, 'remove_link': self._remove_link}
+        events = []
+        for operation, *args in changes:
+            if operation not in operations:
+                raise ValueError(f"Unknown topology change: {operation}")
+            if operation == 'add_node':
+                args = (list(args) + ['router'])[:3]
+            event = operations[operation](*args)
+            if event:
+                events.append(event)
+        for event in events:
+            self._notify(*event)
+
+    def link_arrays(self):
+        """
+        Returns the live links as NumPy arrays.
+
+        The arrays are copies: a NumPy view would keep the underlying
+        storage exported, and every later add_node or add_link would then
+        fail to grow it.
+
+        Returns:
+        --------
+        tuple
+            (sources, destinations, bandwidths, weights) indexed by link,
+            with endpoints given as internal node ids.
+        """
+        live = np.array(self.link_alive, dtype=bool)
+        return (np.array(self.link_sources, dtype=np.int32)[live],
+                np.array(self.link_destinations, dtype=np.int32)[live],
+                np.array(self.link_bandwidths, dtype=np.float64)[live],
+                np.array(self.link_weights, dtype=np.float64)[live])
+
+    def csr(self):
+        """
+        Returns the CSR adjacency of the live topology, building it on first
+        use after a change.
+
+        Returns:
+        --------
+        tuple
+            (names, offsets, neighbors, weights), where the neighbours of
+            node i (named names[i]) are neighbors[offsets[i]:offsets[i + 1]]
+            with link weights weights[offsets[i]:offsets[i + 1]].
+        """
+        if self._csr is None:
+            sources, destinations, _, weights = self.link_arrays()
+            # A repeated link replaces the weight of the earlier one, as in Network.graph
+            keys = np.minimum(sources, destinations).astype(np.int64) * len(self.node_names) + np.maximum(sources, destinations)
+            _, last = np.unique(keys[::-1], return_index=True)
+            latest = np.sort(len(keys) - 1 - last)
+            sources, destinations, weights = sources[latest], destinations[latest], weights[latest]
+            alive = np.array(self.node_alive, dtype=bool)
+            names = [name for name, live in zip(self.node_names, alive) if live]
+            # Renumber the live nodes consecutively
+            renumber = np.cumsum(alive) - 1
+            heads = renumber[np.concatenate([sources, destinations])]
+            tails = renumber[np.concatenate([destinations, sources])]
+            order = np.argsort(heads, kind='stable')
+            offsets = np.zeros(len(names) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(heads, minlength=len(names)), out=offsets[1:])
+            self._csr = (names, offsets, tails[order], np.concatenate([weights, weights])[order])
+        return self._csr
+
+    @property
+    def graph(self):
+        """
+        A networkx graph of the live topology, built on first use after a
+        change and replaced by the next change.
+        """
+        if self._graph is None:
+            names, offsets, neighbors, weights = self.csr()
+            graph = nx.Graph()
+            graph.add_nodes_from((name, {'node_type': self.node_types[self.name_ids[name]]}) for name in names)
+            heads = np.repeat(np.arange(len(names)), np.diff(offsets))
+            graph.add_weighted_edges_from((names[head], names[tail], weight) for head, tail, weight
+                                          in zip(heads.tolist(), neighbors.tolist(), weights.tolist()))
+            self._graph = graph
+        return self._graph
+
+    @property
+    def nodes(self):
+        """
+        A dictionary of node IDs to Node views of the live nodes.
+        """
+        return {key: Node(key, self.node_names[internal_id], self.node_types[internal_id])
+                for key, internal_id in self.ids.items()}
+
+    @property
+    def links(self):
+        """
+        A list of Link views of the live links.
+        """
+        nodes = [Node(key, name, node_type) for key, name, node_type
+                 in zip(self.node_keys, self.node_names, self.node_types)]
+        sources, destinations, bandwidths, _ = self.link_arrays()
+        return [Link(nodes[source], nodes[destination], bandwidth) for source, destination, bandwidth
+                in zip(sources.tolist(), destinations.tolist(), bandwidths.tolist())]
+
+    def display_network(self):
+        """
+        Prints the nodes and links in the network.
+        """
+        print("Nodes in the network:")
+        for node in self.nodes.values():
+            print(node)
+        print("\nLinks in the network:")
+        for link in self.links:
+            print(link)
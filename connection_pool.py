@@ -0,0 +1,238 @@
+import select
+import socket
+import threading
+from collections import deque
+from wire import HEADER, send_buffers
+
+# Messages with payloads up to this size are queued and coalesced; larger ones are streamed
+COALESCE_LIMIT = 16 * 1024
+
+
+class Channel:
+    """
+    A long-lived connection to one next hop, with a bounded outbound queue.
+
+    Small messages are queued and written by a single writer thread, which
+    drains everything queued at once into one gathering write, so bursts of
+    messages cost one system call instead of one or more each. A full queue
+    blocks the senders. Large messages are streamed directly instead (see
+    relay), after flushing the queue, so messages leave in the order they
+    were given. Before each write the connection is checked for a close or
+    reset by the peer and reopened if needed.
+
+    Delivery is at most once. Next hops do not acknowledge messages, so a
+    batch written into a connection the peer has dropped without the reset
+    reaching us yet is accepted by the kernel and lost without an error.
+
+    Attributes:
+    host (str): Host of the next hop.
+    port (int): Listening port of the next hop.
+    timeout (float): Connect and send timeout in seconds.
+    max_queue (int): Most messages waiting in the queue.
+    """
+
+    def __init__(self, host, port, timeout=5.0, max_queue=1024):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.sock = None
+        # Held by whoever writes on the socket; queued messages only leave the queue under it
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.queue_changed = threading.Condition()
+        self.writer = None
+
+    def _connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _healthy(self):
+        """
+        Returns False if the peer closed or reset the connection. The next
+        hop never writes on it, so the socket only becomes readable at the
+        end of the stream or on an error.
+        """
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def _ensure_connected(self):
+        if self.sock is None or not self._healthy():
+            self._close()
+            self._connect()
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+    def _flush(self):
+        """
+        Writes every queued message in one gathering write. Must be called
+        with the lock held.
+
+        If the write fails before any byte of the batch was sent, the batch
+        is sent once more on a new connection; otherwise it is dropped. This
+        does not make stale connections reliable: the first write on one
+        usually succeeds, and the batch is lost (see the class docstring).
+        """
+        with self.queue_changed:
+            batch = [buffer for message in self.queue for buffer in message]
+            count = len(self.queue)
+            self.queue.clear()
+            self.queue_changed.notify_all()
+        if not batch:
+            return
+        try:
+            self._ensure_connected()
+            try:
+                send_buffers(self.sock, batch)
+            except OSError as e:
+                if e.bytes_written != 0:
+                    raise
+                self._close()
+                self._connect()
+                send_buffers(self.sock, batch)
+        except OSError as e:
+            self._close()
+            print(f"Error while sending to port {self.port}, {count} messages dropped: {e}")
+
+    def _write(self):
+        """
+        Body of the writer thread: waits for queued messages and flushes them.
+        """
+        while True:
+            with self.queue_changed:
+                while not self.queue:
+                    self.queue_changed.wait()
+            with self.lock:
+                self._flush()
+
+    def send(self, *buffers):
+        """
+        Queues one message, made of the given buffers, for the writer
+        thread. Blocks while the queue is full. The buffers must not be
+        modified afterwards.
+
+        Parameters:
+        buffers (bytes or memoryview): Consecutive parts of the message.
+        """
+        with self.queue_changed:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write, daemon=True)
+                self.writer.start()
+            while len(self.queue) >= self.max_queue:
+                self.queue_changed.wait()
+            self.queue.append(buffers)
+            if len(self.queue) == 1:
+                # The writer only waits on an empty queue
+                self.queue_changed.notify_all()
+
+    def relay(self, header, reader):
+        """
+        Forwards one message from an inbound MessageReader.
+
+        Payloads up to COALESCE_LIMIT are read and queued like send. Larger
+        ones are streamed without being read whole (see MessageReader.relay)
+        once the queue has been flushed. Their payload cannot be replayed,
+        so a failure part way through closes the connection: the receiver
+        drops the truncated message and the next write reconnects.
+
+        Parameters:
+        header (wire.Header): Header to send in front of the payload.
+        reader (wire.MessageReader): Reader positioned on the payload of the message.
+
+        Raises:
+        OSError: If a streamed message could not be relayed.
+        """
+        if header.length <= COALESCE_LIMIT:
+            self.send(HEADER.pack(*header), bytes(reader.read_payload(header)))
+            return
+        with self.lock:
+            self._flush()
+            try:
+                self._ensure_connected()
+            except OSError:
+                reader.skip(header)
+                raise
+            try:
+                reader.relay(header, self.sock.sendall)
+            except OSError:
+                self._close()
+                raise
+
+    def close(self):
+        """
+        Flushes the queue and closes the connection.
+        """
+        with self.lock:
+            self._flush()
+            self._close()
+
+
+class ConnectionPool:
+    """
+    A pool of persistent connections keyed by next-hop port.
+
+    Attributes:
+    host (str): Host all next hops listen on.
+    channels (dict): The Channel of each port connected so far.
+    """
+
+    def __init__(self, host="localhost"):
+        self.host = host
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def channel(self, port):
+        """
+        Returns the channel to a port, creating it on first use.
+
+        Parameters:
+        port (int): Listening port of the next hop.
+
+        Returns:
+        Channel: The shared channel to that port.
+        """
+        channel = self.channels.get(port)
+        if channel is None:
+            with self.lock:
+                channel = self.channels.setdefault(port, Channel(self.host, port))
+        return channel
+
+    def send(self, port, *buffers):
+        """
+        Queues one message for a port's pooled connection (see Channel.send).
+
+        Parameters:
+        port (int): Listening port of the next hop.
+        buffers (bytes or memoryview): Consecutive parts of the message.
+        """
+        self.channel(port).send(*buffers)
+
+    def relay(self, port, header, reader):
+        """
+        Forwards one message from an inbound MessageReader to a port over
+        its pooled connection (see Channel.relay).
+        """
+        self.channel(port).relay(header, reader)
+
+    def queue_depths(self):
+        """
+        Returns the number of messages waiting in the outbound queue of each port.
+        """
+        return {port: len(channel.queue) for port, channel in list(self.channels.items())}
+
+    def close(self):
+        """
+        Closes every pooled connection.
+        """
+        with self.lock:
+            for channel in self.channels.values():
+                channel.close()
+            self.channels.clear()
@@ -1,6 +1,8 @@
+import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 from network import Network
+from compact_network import CompactNetwork
 
 def find_path_bellman_ford(self, start_node_name, end_node_name):
     """
@@ -109,6 +111,240 @@ def compute_shortest_paths_bellman_ford(network):
 
     return shortest_paths
 
+def graph_arrays(network):
+    """
+    Converts the network graph into index-based NumPy edge arrays.
+
+    Every undirected link appears twice, once in each direction, and the
+    arrays are sorted by destination index so that relaxations can be
+    reduced per destination with np.minimum.reduceat.
+
+    Parameters:
+    -----------
+    network : Network or CompactNetwork
+        The network object containing nodes and links. The arrays of a
+        CompactNetwork are taken from its CSR adjacency without touching
+        the networkx graph.
+
+    Returns:
+    --------
+    tuple
+        (names, sources, destinations, weights), where names is the list of
+        node names and the other three are arrays of equal length indexed
+        by position in names.
+
+    Raises:
+    -------
+    ValueError
+        If a link has a zero weight: its endpoints could then be each
+        other's predecessor, and the predecessor walks would never end.
+    """
+    if isinstance(network, CompactNetwork):
+        names, offsets, neighbors, weights = network.csr()
+        destinations = np.repeat(np.arange(len(names)), np.diff(offsets))
+        sources = neighbors
+    else:
+        names = list(network.graph.nodes())
+        index = {name: i for i, name in enumerate(names)}
+        edges = [(index[u], index[v], data['weight']) for u, v, data in network.graph.edges(data=True)]
+        sources = np.array([u for u, v, w in edges] + [v for u, v, w in edges], dtype=np.int64)
+        destinations = np.array([v for u, v, w in edges] + [u for u, v, w in edges], dtype=np.int64)
+        weights = np.array([w for u, v, w in edges] * 2, dtype=np.float64)
+        order = np.argsort(destinations, kind='stable')
+        sources, destinations, weights = sources[order], destinations[order], weights[order]
+    if (weights == 0).any():
+        raise ValueError("Link weights must not be zero")
+    return names, sources, destinations, weights
+
+def compute_shortest_paths_bellman_ford_vectorized(network):
+    """
+    Computes the shortest paths from all nodes to all other nodes using a
+    vectorized Bellman-Ford algorithm.
+
+    All sources are relaxed together: each round evaluates every edge for
+    every source as one (sources x edges) array and reduces it per
+    destination node. Rounds stop as soon as no distance improves.
+
+    Parameters:
+    -----------
+    network : Network
+        The network object containing nodes and links.
+
+    Returns:
+    --------
+    dict
+        A dictionary of shortest paths from each node to all other nodes,
+        in the same format as compute_shortest_paths_bellman_ford.
+    None
+        If a negative weight cycle is detected.
+    """
+    names, sources, destinations, weights = graph_arrays(network)
+    node_count = len(names)
+    distances = np.full((node_count, node_count), np.inf)
+    np.fill_diagonal(distances, 0)
+    predecessors = np.full((node_count, node_count), -1, dtype=np.int64)
+
+    if len(sources):
+        starts = np.flatnonzero(np.r_[True, destinations[1:] != destinations[:-1]])
+        targets = destinations[starts]
+        converged = False
+        for _ in range(node_count):
+            candidates = np.minimum.reduceat(distances[:, sources] + weights, starts, axis=1)
+            improved = candidates < distances[:, targets]
+            if not improved.any():
+                converged = True
+                break
+            distances[:, targets] = np.where(improved, candidates, distances[:, targets])
+        if not converged:
+            print("The graph contains a negative weight cycle")
+            return None
+
+        # The predecessor of each node is the first edge that achieves its distance
+        candidates = distances[:, sources] + weights
+        edge_ids = np.where(candidates == distances[:, destinations], np.arange(len(sources)), len(sources))
+        best_edges = np.minimum.reduceat(edge_ids, starts, axis=1)
+        reached = (best_edges < len(sources)) & (targets != np.arange(node_count)[:, None])
+        predecessors[:, targets] = np.where(reached, sources[np.minimum(best_edges, len(sources) - 1)], -1)
+
+    shortest_paths = {}
+    for source in range(node_count):
+        source_paths = {}
+        for target in range(node_count):
+            if np.isinf(distances[source, target]):
+                source_paths[names[target]] = None
+                continue
+            path = [target]
+            while path[-1] != source:
+                if len(path) > node_count:
+                    raise RuntimeError(f"Predecessor cycle on the path from {names[source]} to {names[target]}")
+                path.append(predecessors[source, path[-1]])
+            source_paths[names[target]] = [names[step] for step in reversed(path)]
+        shortest_paths[names[source]] = source_paths
+
+    return shortest_paths
+
+def _min_plus_update(distances, predecessors, left, right, right_predecessors):
+    """
+    Relaxes a distance block with the min-plus product of two blocks.
+
+    distances[i, j] becomes min(distances[i, j], min_k left[i, k] + right[k, j]),
+    and predecessors[i, j] takes right_predecessors[k, j] for the k that
+    improved it. The arguments may be views of the same matrices.
+    """
+    candidates = left[:, :, None] + right[None, :, :]
+    best_k = candidates.argmin(axis=1)
+    columns = np.arange(right.shape[1])
+    best = np.take_along_axis(candidates, best_k[:, None, :], axis=1)[:, 0, :]
+    improved = best < distances
+    best_predecessors = right_predecessors[best_k, columns]
+    distances[improved] = best[improved]
+    predecessors[improved] = best_predecessors[improved]
+
+def compute_shortest_paths_floyd_warshall(network, block_size=64):
+    """
+    Computes the shortest paths between all pairs of nodes using a blocked
+    min-plus Floyd-Warshall algorithm.
+
+    The distance matrix is processed in block_size x block_size tiles so
+    that each step works on cache-sized blocks: for every pivot block the
+    diagonal tile is closed first, then its row and column tiles, then all
+    remaining tiles, each as a NumPy min-plus product. Link weights must
+    be positive, as they are for bandwidth-derived weights.
+
+    Parameters:
+    -----------
+    network : Network
+        The network object containing nodes and links.
+    block_size : int, optional
+        The tile size in nodes (default is 64).
+
+    Returns:
+    --------
+    tuple
+        (names, distances, predecessors), where distances[i, j] is the cost
+        of the shortest path from names[i] to names[j] (inf if unreachable)
+        and predecessors[i, j] is the index of the node before names[j] on
+        that path (-1 if unreachable or i == j).
+
+    Raises:
+    -------
+    ValueError
+        If a link weight is not positive.
+    """
+    names, sources, destinations, weights = graph_arrays(network)
+    if (weights < 0).any():
+        raise ValueError("Link weights must be positive")
+    node_count = len(names)
+    distances = np.full((node_count, node_count), np.inf)
+    np.minimum.at(distances, (sources, destinations), weights)
+    np.fill_diagonal(distances, 0)
+    predecessors = np.where(np.isinf(distances), -1, np.arange(node_count)[:, None])
+    np.fill_diagonal(predecessors, -1)
+
+    blocks = [slice(start, min(start + block_size, node_count)) for start in range(0, node_count, block_size)]
+    for pivot in blocks:
+        # Close the diagonal tile one intermediate node at a time
+        tile = distances[pivot, pivot]
+        tile_predecessors = predecessors[pivot, pivot]
+        for k in range(tile.shape[0]):
+            candidates = tile[:, k, None] + tile[None, k, :]
+            improved = candidates < tile
+            tile[improved] = candidates[improved]
+            tile_predecessors[improved] = np.broadcast_to(tile_predecessors[k, :], tile.shape)[improved]
+
+        for other in blocks:
+            if other != pivot:
+                _min_plus_update(distances[pivot, other], predecessors[pivot, other],
+                                 distances[pivot, pivot], distances[pivot, other], predecessors[pivot, other])
+                _min_plus_update(distances[other, pivot], predecessors[other, pivot],
+                                 distances[other, pivot], distances[pivot, pivot], predecessors[pivot, pivot])
+
+        for row in blocks:
+            if row == pivot:
+                continue
+            for column in blocks:
+                if column != pivot:
+                    _min_plus_update(distances[row, column], predecessors[row, column],
+                                     distances[row, pivot], distances[pivot, column], predecessors[pivot, column])
+
+    return names, distances, predecessors
+
+def path_from_predecessors(predecessors, source, target):
+    """
+    Rebuilds a shortest path from a predecessor matrix.
+
+    Parameters:
+    -----------
+    predecessors : numpy.ndarray
+        The predecessor matrix returned by compute_shortest_paths_floyd_warshall.
+    source : int
+        The index of the source node.
+    target : int
+        The index of the target node.
+
+    Returns:
+    --------
+    list
+        The node indices of the path from source to target.
+    None
+        If target is not reachable from source.
+
+    Raises:
+    -------
+    RuntimeError
+        If the predecessors form a cycle.
+    """
+    path = [target]
+    while path[-1] != source:
+        if len(path) > len(predecessors):
+            raise RuntimeError(f"Predecessor cycle on the path from {source} to {target}")
+        step = predecessors[source, path[-1]]
+        if step < 0:
+            return None
+        path.append(int(step))
+    path.reverse()
+    return path
+
 def find_shortest_path_dijks(network, source_name, destination_name, weight='weight'):
     """
     Finds the shortest path from source_name to destination_name using Dijkstra's algorithm.
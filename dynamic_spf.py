@@ -0,0 +1,235 @@
+import heapq
+import threading
+
+
+class DynamicSPF:
+    """
+    A class to maintain all-pairs shortest paths incrementally.
+
+    One shortest-path tree (distances and predecessors) is kept per source
+    node. When the topology changes, only the trees that the change can
+    affect are repaired: a removed or heavier tree edge invalidates the
+    subtree hanging below it, which is re-attached from its unaffected
+    neighbours; a new or lighter link is relaxed outwards from its endpoints.
+    Trees that do not use the changed element are left untouched.
+
+    The engine is registered as a listener of a Network object, which calls
+    it after every add_node, add_link, remove_link and remove_node. Repairs
+    always read the current graph, so the notifications of a batch applied
+    with Network.apply_changes can be replayed after the graph already
+    reflects all of them.
+
+    Attributes:
+    -----------
+    graph : networkx.Graph
+        The graph whose shortest paths are maintained.
+    distances : dict
+        Per source, a dictionary of reachable node names to path cost.
+    predecessors : dict
+        Per source, a dictionary of reachable node names to their parent in
+        the shortest-path tree (None for the source itself).
+
+    Methods:
+    --------
+    __init__(graph, weight='weight'):
+        Builds the shortest-path trees of every node in the graph.
+
+    node_added(name), node_removed(name), link_added(source_name,
+    destination_name, weight), link_removed(source_name, destination_name):
+        Network listener callbacks that repair the affected trees.
+
+    paths(source):
+        Returns the shortest paths from source to every reachable node.
+
+    all_paths():
+        Returns the shortest paths between all pairs of nodes.
+    """
+
+    def __init__(self, graph, weight='weight'):
+        """
+        Builds the shortest-path trees of every node in the graph.
+
+        Parameters:
+        -----------
+        graph : networkx.Graph
+            The graph whose shortest paths are maintained.
+        weight : str, optional
+            The edge attribute to be used as weight (default is 'weight').
+        """
+        self.graph = graph
+        self.weight = weight
+        self.distances = {}
+        self.predecessors = {}
+        self._paths = {}
+        self._lock = threading.RLock()
+        for source in graph.nodes():
+            self._build_tree(source)
+
+    def _build_tree(self, source):
+        """
+        Runs a full Dijkstra from source and stores the resulting tree.
+        """
+        self.distances[source] = {source: 0}
+        self.predecessors[source] = {source: None}
+        self._paths.pop(source, None)
+        self._relax(source, [(0, source)])
+
+    def _relax(self, source, heap):
+        """
+        Propagates tentative distances of the tree of source from the heap.
+        """
+        distances = self.distances[source]
+        predecessors = self.predecessors[source]
+        heapq.heapify(heap)
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances.get(node, float('inf')):
+                continue
+            for neighbor, data in self.graph[node].items():
+                candidate = distance + data[self.weight]
+                if candidate < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = candidate
+                    predecessors[neighbor] = node
+                    heapq.heappush(heap, (candidate, neighbor))
+
+    def _subtree(self, source, root):
+        """
+        Returns root and all of its descendants in the tree of source.
+        """
+        children = {}
+        for node, parent in self.predecessors[source].items():
+            if parent is not None:
+                children.setdefault(parent, []).append(node)
+        subtree = [root]
+        for node in subtree:
+            subtree.extend(children.get(node, ()))
+        return subtree
+
+    def _repair(self, source, root):
+        """
+        Detaches the subtree below root from the tree of source and
+        re-attaches its nodes through their best remaining neighbours.
+        """
+        distances = self.distances[source]
+        predecessors = self.predecessors[source]
+        invalid = self._subtree(source, root)
+        for node in invalid:
+            del distances[node]
+            del predecessors[node]
+        heap = []
+        for node in invalid:
+            if node not in self.graph:
+                continue
+            for neighbor, data in self.graph[node].items():
+                if neighbor not in distances:
+                    continue
+                candidate = distances[neighbor] + data[self.weight]
+                if candidate < distances.get(node, float('inf')):
+                    distances[node] = candidate
+                    predecessors[node] = neighbor
+            if node in distances:
+                heap.append((distances[node], node))
+        self._relax(source, heap)
+        self._paths.pop(source, None)
+
+    def node_added(self, name):
+        """
+        Starts a tree for a newly added (still unlinked) node.
+        """
+        with self._lock:
+            if name in self.graph and name not in self.distances:
+                self._build_tree(name)
+
+    def node_removed(self, name):
+        """
+        Drops the tree of a removed node and repairs the trees that used it.
+        """
+        with self._lock:
+            self.distances.pop(name, None)
+            self.predecessors.pop(name, None)
+            self._paths.pop(name, None)
+            for source in self.distances:
+                if name in self.distances[source]:
+                    self._repair(source, name)
+
+    def link_added(self, source_name, destination_name, weight):
+        """
+        Repairs the trees after a link was added or its weight changed.
+        """
+        with self._lock:
+            # The graph may already reflect later changes of the same batch
+            if not self.graph.has_edge(source_name, destination_name):
+                return
+            weight = self.graph[source_name][destination_name][self.weight]
+            for source in self.distances:
+                distances = self.distances[source]
+                predecessors = self.predecessors[source]
+                # A heavier tree edge first detaches the subtree below it
+                for u, v in ((source_name, destination_name), (destination_name, source_name)):
+                    if predecessors.get(v) == u and distances[u] + weight > distances[v]:
+                        self._repair(source, v)
+                heap = []
+                for u, v in ((source_name, destination_name), (destination_name, source_name)):
+                    if u in distances and distances[u] + weight < distances.get(v, float('inf')):
+                        distances[v] = distances[u] + weight
+                        predecessors[v] = u
+                        heap.append((distances[v], v))
+                if heap:
+                    self._relax(source, heap)
+                    self._paths.pop(source, None)
+
+    def link_removed(self, source_name, destination_name):
+        """
+        Repairs the trees that routed over a removed link.
+        """
+        with self._lock:
+            for source in self.distances:
+                predecessors = self.predecessors[source]
+                if predecessors.get(destination_name) == source_name:
+                    self._repair(source, destination_name)
+                elif predecessors.get(source_name) == destination_name:
+                    self._repair(source, source_name)
+
+    def paths(self, source):
+        """
+        Returns the shortest paths from source to every reachable node.
+
+        Parameters:
+        -----------
+        source : str
+            The name of the source node.
+
+        Returns:
+        --------
+        dict
+            A dictionary of destination names to paths (lists of node names).
+        """
+        with self._lock:
+            if source not in self._paths:
+                predecessors = self.predecessors[source]
+                paths = {source: [source]}
+                for node in predecessors:
+                    chain = []
+                    while node not in paths:
+                        chain.append(node)
+                        node = predecessors[node]
+                    for step in reversed(chain):
+                        paths[step] = paths[node] + [step]
+                        node = step
+                self._paths[source] = paths
+            return self._paths[source]
+
+    def all_paths(self):
+        """
+        Returns the shortest paths between all pairs of nodes.
+
+        Only the trees repaired since the previous call are converted to
+        path lists again.
+
+        Returns:
+        --------
+        dict
+            A dictionary of source names to the result of paths(source).
+        """
+        with self._lock:
+            return {source: self.paths(source) for source in self.distances}
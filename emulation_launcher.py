@@ -0,0 +1,142 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import networkx as nx
+from node_runtime import NodeRuntime
+
+
+def traversal_order(graph):
+    """
+    Lists the nodes of a graph in breadth-first order, starting each
+    connected component from a node far from its centre, so that any
+    prefix of the order is a compact region of the graph.
+
+    Parameters:
+    -----------
+    graph : networkx.Graph
+        The graph to traverse.
+
+    Returns:
+    --------
+    list
+        Every node of the graph.
+    """
+    order = []
+    for component in nx.connected_components(graph):
+        start = next(iter(component))
+        # The last node reached from any node lies on the periphery
+        start = list(nx.bfs_tree(graph, start))[-1]
+        order.extend(nx.bfs_tree(graph, start))
+    return order
+
+
+def partition_network(network, parts):
+    """
+    Splits the nodes of a network into balanced parts with few links
+    between them, by recursive bisection.
+
+    Each bisection cuts a breadth-first order of the nodes at the size
+    of each side, then refines the cut with Kernighan-Lin swaps, which keep
+    the sizes unchanged while reducing the number of links cut.
+
+    Parameters:
+    -----------
+    network : Network or CompactNetwork
+        The network object containing nodes and links.
+    parts : int
+        The number of parts.
+
+    Returns:
+    --------
+    list
+        The lists of node names in each part, of sizes differing by at most one.
+    """
+    graph = network.graph
+    return _bisect(graph, list(graph.nodes), min(parts, graph.number_of_nodes()))
+
+
+def _bisect(graph, nodes, parts):
+    if parts <= 1:
+        return [nodes]
+    left_parts = parts // 2
+    subgraph = graph.subgraph(nodes)
+    order = traversal_order(subgraph)
+    size = len(nodes) * left_parts // parts
+    left, right = nx.community.kernighan_lin_bisection(
+        subgraph, partition=(set(order[:size]), set(order[size:])), weight=None, seed=0)
+    if len(left) != size:
+        # The sides may come back in either order
+        left, right = right, left
+    return (_bisect(graph, [node for node in order if node in left], left_parts) +
+            _bisect(graph, [node for node in order if node in right], parts - left_parts))
+
+
+def run_partition(node_names, cpu, server_host, server_port, port_mapping, ipc_paths):
+    """
+    Runs one NodeRuntime hosting a part of the network, pinned to a core.
+
+    This is the body of the worker processes.
+    """
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+    runtime = NodeRuntime(server_host, server_port, port_mapping, node_names, ipc_paths=ipc_paths)
+    asyncio.run(runtime.run())
+
+
+def launch(network, port_mapping, server_host="localhost", server_port=1000, parts=None, ipc_dir=None):
+    """
+    Starts the emulation of a network across the cores of this machine.
+
+    The network is partitioned into one part per core, and every part is
+    hosted by a NodeRuntime in its own process, pinned to its core. Hops
+    inside a part stay in memory; links cut by the partition are crossed
+    over Unix sockets, or over TCP where they are not available.
+
+    Parameters:
+    -----------
+    network : Network or CompactNetwork
+        The network to emulate, as known by the controller.
+    port_mapping : dict
+        A dictionary of node names to listening ports, as in port_mapping.json.
+    server_host : str, optional
+        Hostname or IP address of the controller (default is 'localhost').
+    server_port : int, optional
+        Port number of the controller (default is 1000).
+    parts : int, optional
+        The number of processes (default is one per usable core).
+    ipc_dir : str, optional
+        The directory of the Unix sockets (default is a new temporary directory).
+
+    Returns:
+    --------
+    list
+        The started multiprocessing.Process objects.
+    """
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else [None] * (os.cpu_count() or 1)
+    partition = partition_network(network, parts or len(cpus))
+    ipc_paths = None
+    if hasattr(socket, "AF_UNIX"):
+        ipc_dir = ipc_dir or tempfile.mkdtemp(prefix="emulation-")
+        ipc_paths = {name: os.path.join(ipc_dir, f"{name}.sock") for names in partition for name in names}
+    processes = []
+    for index, node_names in enumerate(partition):
+        process = multiprocessing.Process(
+            target=run_partition, daemon=True,
+            args=(node_names, cpus[index % len(cpus)], server_host, server_port, port_mapping, ipc_paths))
+        process.start()
+        processes.append(process)
+        print(f"Process {process.pid} hosting {len(node_names)} nodes: {', '.join(node_names)}")
+    return processes
+
+
+# Ejemplo de uso
+# Emulates the controller's topology with one process per core
+if __name__ == "__main__":
+    from Controller1 import network
+    with open("port_mapping.json", "r") as file:
+        port_mapping = json.load(file)
+    for process in launch(network, port_mapping):
+        process.join()
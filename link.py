@@ -20,6 +20,8 @@ class Link:
         Returns a string representation of the Link object.
     """
 
+    __slots__ = ('source', 'destination', 'bandwidth')
+
     def __init__(self, source, destination, bandwidth):
         """
         Constructs all the necessary attributes for the Link object.
@@ -12,15 +12,26 @@ class Network:
     nodes : dict
         A dictionary to store nodes with node IDs as keys and Node objects as values.
     links : list
-        A list to store Link objects representing the links between nodes.
+        A list of Link objects representing the links between nodes, built
+        from an insertion-ordered index on each read.
     graph : networkx.Graph
         A graph to represent the network topology.
+    listeners : list
+        Objects notified of every topology change (see add_listener).
+    node_ids : dict
+        An index of node names to node IDs.
+    incident_links : dict
+        An index of node IDs to the links attached to them, so that node and
+        link removals only visit the links of the nodes involved.
 
     Methods:
     --------
     __init__():
         Initializes the Network object with empty nodes, links, and a graph.
 
+    add_listener(listener):
+        Registers an object to be notified of topology changes.
+
     add_node(node_id, name, node_type='router'):
         Adds a node to the network.
 
@@ -33,6 +44,9 @@ class Network:
     remove_link(source_id, destination_id):
         Removes a link between two nodes in the network.
 
+    apply_changes(changes):
+        Applies a batch of topology changes with a single graph update.
+
     display_network():
         Prints the nodes and links in the network.
 
@@ -45,8 +59,95 @@ class Network:
         Initializes the Network object with empty nodes, links, and a graph.
         """
         self.nodes = {}
-        self.links = []
+        # Insertion-ordered set of the links (every value is None)
+        self._links = {}
         self.graph = nx.Graph()
+        self.listeners = []
+        self.node_ids = {}
+        self.incident_links = {}
+
+    def add_listener(self, listener):
+        """
+        Registers an object to be notified of topology changes.
+
+        Listeners are called after the graph has been updated, through the
+        methods node_added(name), node_removed(name),
+        link_added(source_name, destination_name, weight) and
+        link_removed(source_name, destination_name). After apply_changes
+        they are called once per change, with the graph already in its
+        final state.
+
+        Parameters:
+        -----------
+        listener : object
+            The object to notify, e.g. a dynamic_spf.DynamicSPF engine.
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, event, *args):
+        for listener in self.listeners:
+            getattr(listener, event)(*args)
+
+    def _index_node(self, node_id, name, node_type):
+        """
+        Adds a node to the indexes. Returns False if the ID is already used.
+        """
+        if node_id in self.nodes:
+            return False
+        self.nodes[node_id] = Node(node_id, name, node_type)
+        self.node_ids[name] = node_id
+        self.incident_links[node_id] = {}
+        return True
+
+    def _index_link(self, source_id, destination_id, bandwidth):
+        """
+        Adds a link to the indexes. Returns the new Link, or None if an
+        endpoint does not exist.
+        """
+        if source_id not in self.nodes or destination_id not in self.nodes:
+            return None
+        link = Link(self.nodes[source_id], self.nodes[destination_id], bandwidth)
+        self._links[link] = None
+        self.incident_links[source_id][link] = None
+        self.incident_links[destination_id][link] = None
+        return link
+
+    def _unindex_node(self, node_name):
+        """
+        Removes a node and its links from the indexes in O(degree).
+        Returns False if no node has that name.
+        """
+        node_id = self.node_ids.pop(node_name, None)
+        if node_id is None:
+            return False
+        for link in self.incident_links.pop(node_id):
+            del self._links[link]
+            other = link.destination if link.source.node_id == node_id else link.source
+            self.incident_links.get(other.node_id, {}).pop(link, None)
+        del self.nodes[node_id]
+        return True
+
+    def _unindex_link(self, source_id, destination_id):
+        """
+        Removes the links from source to destination from the indexes in
+        O(degree). Returns False if an endpoint does not exist.
+        """
+        if source_id not in self.nodes or destination_id not in self.nodes:
+            return False
+        source, destination = self.nodes[source_id], self.nodes[destination_id]
+        for link in [link for link in self.incident_links[source_id]
+                     if link.source is source and link.destination is destination]:
+            del self._links[link]
+            del self.incident_links[source_id][link]
+            self.incident_links[destination_id].pop(link, None)
+        return True
+
+    @property
+    def links(self):
+        """
+        A list of Link objects representing the links between nodes.
+        """
+        return list(self._links)
 
     def add_node(self, node_id, name, node_type='router'):
         """
@@ -61,9 +162,9 @@ class Network:
         node_type : str, optional
             The type of the node (default is 'router').
         """
-        if node_id not in self.nodes:
-            self.nodes[node_id] = Node(node_id, name, node_type)
+        if self._index_node(node_id, name, node_type):
             self.graph.add_node(name, node_type=node_type)
+            self._notify('node_added', name)
 
     def add_link(self, source_id, destination_id, bandwidth):
         """
@@ -78,11 +179,10 @@ class Network:
         bandwidth : float
             The bandwidth of the link in Gbps.
         """
-        if source_id in self.nodes and destination_id in self.nodes:
-            source_node = self.nodes[source_id]
-            destination_node = self.nodes[destination_id]
-            self.links.append(Link(source_node, destination_node, bandwidth))
-            self.graph.add_edge(source_node.name, destination_node.name, weight=1/bandwidth)
+        link = self._index_link(source_id, destination_id, bandwidth)
+        if link is not None:
+            self.graph.add_edge(link.source.name, link.destination.name, weight=1/bandwidth)
+            self._notify('link_added', link.source.name, link.destination.name, 1/bandwidth)
         else:
             print(f"Error: Nodes {source_id} and/or {destination_id} not found in the network")
 
@@ -95,14 +195,11 @@ class Network:
         node_name : str
             The name of the node to be removed.
         """
-        for node_id, node in self.nodes.items():
-            if node.name == node_name:
-                del self.nodes[node_id]
-                self.graph.remove_node(node_name)
-                self.links = [link for link in self.links if
-                              link.source.name != node_name and link.destination.name != node_name]
-                return
-        print(f"Error: Node with name {node_name} not found")
+        if self._unindex_node(node_name):
+            self.graph.remove_node(node_name)
+            self._notify('node_removed', node_name)
+        else:
+            print(f"Error: Node with name {node_name} not found")
 
     def remove_link(self, source_id, destination_id):
         """
@@ -115,13 +212,80 @@ class Network:
         destination_id : str
             The unique identifier for the destination node.
         """
-        if source_id in self.nodes and destination_id in self.nodes:
+        if self._unindex_link(source_id, destination_id):
             self.graph.remove_edge(self.nodes[source_id].name, self.nodes[destination_id].name)
-            self.links = [link for link in self.links if
-                          link.source != self.nodes[source_id] or link.destination != self.nodes[destination_id]]
+            self._notify('link_removed', self.nodes[source_id].name, self.nodes[destination_id].name)
         else:
             print("Error: Source or destination node not found")
 
+    def apply_changes(self, changes):
+        """
+        Applies a batch of topology changes in one transaction.
+
+        The indexes are updated change by change, then the graph is brought
+        to its final state with one bulk update, and finally the listeners
+        are notified of every change that took effect.
+
+        Parameters:
+        -----------
+        changes : list
+            Tuples in one of the forms
+            ('add_node', node_id, name[, node_type]),
+            ('add_link', source_id, destination_id, bandwidth),
+            ('remove_node', node_name) or
+            ('remove_link', source_id, destination_id).
+        """
+        events = []
+        removed_nodes = set()
+        added_nodes = {}
+        edges = {}
+        # The pairs in edges that each node belongs to
+        node_edges = {}
+        for operation, *args in changes:
+            if operation == 'add_node':
+                node_id, name, node_type = (list(args) + ['router'])[:3]
+                if self._index_node(node_id, name, node_type):
+                    added_nodes[name] = node_type
+                    events.append(('node_added', name))
+            elif operation == 'add_link':
+                link = self._index_link(*args)
+                if link is None:
+                    print(f"Error: Nodes {args[0]} and/or {args[1]} not found in the network")
+                    continue
+                pair = frozenset((link.source.name, link.destination.name))
+                edges[pair] = (link.source.name, link.destination.name, 1/link.bandwidth)
+                for name in pair:
+                    node_edges.setdefault(name, set()).add(pair)
+                events.append(('link_added', link.source.name, link.destination.name, 1/link.bandwidth))
+            elif operation == 'remove_node':
+                if not self._unindex_node(args[0]):
+                    print(f"Error: Node with name {args[0]} not found")
+                    continue
+                removed_nodes.add(args[0])
+                added_nodes.pop(args[0], None)
+                for pair in node_edges.pop(args[0], ()):
+                    edges.pop(pair, None)
+                events.append(('node_removed', args[0]))
+            elif operation == 'remove_link':
+                if not self._unindex_link(*args):
+                    print("Error: Source or destination node not found")
+                    continue
+                source_name, destination_name = self.nodes[args[0]].name, self.nodes[args[1]].name
+                pair = frozenset((source_name, destination_name))
+                edges[pair] = (source_name, destination_name, None)
+                for name in pair:
+                    node_edges.setdefault(name, set()).add(pair)
+                events.append(('link_removed', source_name, destination_name))
+            else:
+                raise ValueError(f"Unknown topology change: {operation}")
+
+        self.graph.remove_nodes_from(removed_nodes)
+        self.graph.add_nodes_from((name, {'node_type': node_type}) for name, node_type in added_nodes.items())
+        self.graph.remove_edges_from((u, v) for u, v, weight in edges.values() if weight is None)
+        self.graph.add_weighted_edges_from((u, v, weight) for u, v, weight in edges.values() if weight is not None)
+        for event in events:
+            self._notify(*event)
+
     def display_network(self):
         """
         Prints the nodes and links in the network.
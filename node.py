@@ -20,6 +20,8 @@ class Node:
         Returns a string representation of the Node object.
     """
 
+    __slots__ = ('node_id', 'name', 'node_type')
+
     def __init__(self, node_id, name, node_type='router'):
         """
         Constructs all the necessary attributes for the Node object.
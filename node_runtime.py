@@ -0,0 +1,341 @@
+import asyncio
+import json
+import os
+import pickle
+import sys
+import rsa
+from routing_table import apply_routing_update, compile_forwarding_table
+from wire import HEADER, HEARTBEAT, node_ids, read_frame, read_message
+
+
+class StreamChannel:
+    """
+    A persistent asyncio connection to a port outside the runtime: a node
+    hosted by another process, or a client. Nodes hosted by other runtimes
+    on the same machine are reached through a Unix socket path instead.
+
+    Messages written while the connection is being opened are kept, up to
+    max_pending of them, and sent once it is up; the messages beyond are
+    dropped and counted. drain waits for the connection to open, so readers
+    awaiting it stop while it does. The connection is reopened on the next
+    write after the peer closes it.
+
+    Attributes:
+    host (str): Host of the peer.
+    port (int): Listening port of the peer.
+    path (str): Unix socket path of the peer, used instead of host and port if given.
+    max_pending (int): Most messages kept while the connection is being opened.
+    dropped (int): Number of messages dropped because they could not be kept or sent.
+    """
+
+    def __init__(self, host, port, path=None, max_pending=1024):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.reader = None
+        self.writer = None
+        self.pending = []
+        self.connecting = None
+
+    def _connected(self):
+        return self.writer is not None and not self.writer.is_closing() and not self.reader.at_eof()
+
+    def write(self, header, payload):
+        """
+        Writes one message to the connection.
+
+        Parameters:
+        header (wire.Header): Header of the message.
+        payload (bytes): Payload of the message.
+        """
+        if self._connected():
+            self.writer.write(HEADER.pack(*header))
+            self.writer.write(payload)
+            return
+        if len(self.pending) // 2 >= self.max_pending:
+            self.dropped += 1
+        else:
+            self.pending += (HEADER.pack(*header), payload)
+        if self.connecting is None:
+            self.connecting = asyncio.ensure_future(self._connect())
+
+    async def _connect(self):
+        try:
+            if self.writer is not None:
+                self.writer.close()
+            if self.path is not None:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+            else:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.writer.writelines(self.pending)
+        except OSError as e:
+            self.writer = None
+            self.dropped += len(self.pending) // 2
+            print(f"Error while connecting to {self.path or self.port}, {len(self.pending) // 2} messages dropped: {e}")
+        finally:
+            self.pending = []
+            self.connecting = None
+
+    async def drain(self):
+        """
+        Waits until the connection is open, if it is being opened, and then
+        until its write buffer is below its high-water mark.
+        """
+        if self.connecting is not None:
+            # Shielded, so that a reader cancelled while waiting does not cancel the connection
+            await asyncio.shield(self.connecting)
+        if self.writer is not None:
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                self.writer.close()
+
+
+class VirtualNode:
+    """
+    A node hosted by a NodeRuntime. It behaves like TCPNode towards the
+    controller, clients and nodes in other processes, but messages whose
+    next hop is hosted by the same runtime are handed over in memory.
+
+    Attributes:
+    runtime (NodeRuntime): The runtime hosting the node.
+    node_name (str): Name of the node.
+    listen_port (int): Port the node accepts messages on.
+    client_port (int): Listening port of the node's client.
+    routing_table (NodeRoutingTable): The routing table received from the controller.
+    forwarding_table (dict): Destination id to the VirtualNode or StreamChannel of the next hop.
+    subscription (asyncio.StreamWriter): The open routing table subscription, or None.
+    """
+
+    def __init__(self, runtime, node_name, listen_port, client_port):
+        self.runtime = runtime
+        self.node_name = node_name
+        self.listen_port = listen_port
+        self.client_port = client_port
+        self.routing_table = None
+        self.forwarding_table = {}
+        self.subscription = None
+
+    def install_routing_table(self, routing_table):
+        """
+        Installs a routing table and compiles its forwarding table.
+
+        Parameters:
+        routing_table (NodeRoutingTable): The updated routing table.
+        """
+        if routing_table is self.routing_table:
+            return
+        self.forwarding_table = compile_forwarding_table(routing_table, self.runtime.node_ids, self.channel_for)
+        self.routing_table = routing_table
+
+    def channel_for(self, next_hop):
+        """
+        Returns where to hand messages for a next hop to: the hosted node
+        itself, or a connection to the client or to another process.
+        """
+        if next_hop == self.node_name:
+            return self.runtime.channel(self.client_port)
+        if next_hop in self.runtime.nodes:
+            return self.runtime.nodes[next_hop]
+        if next_hop in self.runtime.ipc_paths:
+            return self.runtime.channel(None, self.runtime.ipc_paths[next_hop])
+        port = self.runtime.port_mapping.get(next_hop)
+        return self.runtime.channel(port) if port is not None else None
+
+    async def request_routing_table(self, mode=""):
+        """
+        Opens a connection to the controller and sends a routing table request.
+
+        Parameters:
+        mode (str): Empty for a single answer, "subscribe" to keep receiving changes.
+
+        Returns:
+        tuple: The (reader, writer) of the connection.
+        """
+        version = "" if self.routing_table is None else self.routing_table.request_version
+        request = f"{self.node_name}:{version}" + (f":{mode}" if mode else "")
+        reader, writer = await asyncio.open_connection(self.runtime.server_host, self.runtime.server_port)
+        writer.write(rsa.encrypt(request.encode(), self.runtime.public_key))
+        return reader, writer
+
+    async def poll_controller(self):
+        """
+        Keeps the node alive in the controller every 15 seconds: with a
+        heartbeat on the subscription while it is open, and otherwise by
+        requesting the routing table.
+        """
+        while True:
+            subscription = self.subscription
+            if subscription is not None and not subscription.is_closing():
+                subscription.write(HEARTBEAT)
+                await asyncio.sleep(15)
+                continue
+            try:
+                reader, writer = await self.request_routing_table()
+                try:
+                    self.install_routing_table(apply_routing_update(self.routing_table, json.loads(await read_frame(reader))))
+                finally:
+                    writer.close()
+            except Exception as e:
+                print(f"Node {self.node_name}: error while connecting to server: {e}")
+            await asyncio.sleep(15)
+
+    async def subscribe_to_controller(self):
+        """
+        Keeps a subscription open with the controller, which pushes routing
+        table changes as soon as they are computed.
+        """
+        while True:
+            try:
+                reader, writer = await self.request_routing_table("subscribe")
+                try:
+                    while True:
+                        update = json.loads(await read_frame(reader))
+                        self.install_routing_table(apply_routing_update(self.routing_table, update))
+                        # The first answer confirms the subscription
+                        self.subscription = writer
+                finally:
+                    self.subscription = None
+                    writer.close()
+            except Exception as e:
+                print(f"Node {self.node_name}: subscription to server lost: {e}")
+            await asyncio.sleep(5)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Handles messages received from clients and nodes in other processes.
+
+        Parameters:
+        reader (asyncio.StreamReader): The stream to read messages from.
+        writer (asyncio.StreamWriter): The stream of the connection.
+        """
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                channel = self.forward(*message)
+                if channel is not None:
+                    # Stop reading while the outbound connection is backed up
+                    await channel.drain()
+        except Exception as e:
+            print(f"Node {self.node_name}: error handling client: {e}")
+        finally:
+            writer.close()
+
+    def forward(self, header, payload):
+        """
+        Routes a received message, following hops between hosted nodes in
+        memory until it leaves the runtime.
+
+        Parameters:
+        header (wire.Header): Header of the message.
+        payload (bytes): Encrypted message content.
+
+        Returns:
+        StreamChannel: The connection the message was written to, or None if it was dropped.
+        """
+        node = self
+        while True:
+            if header.ttl == 0:
+                print(f"Node {node.node_name}: TTL expired for message to id {header.destination}. Dropping it.")
+                return None
+            header = header._replace(ttl=header.ttl - 1)
+            next_hop = node.forwarding_table.get(header.destination)
+            if next_hop is None:
+                print(f"Node {node.node_name}: no route found to id {header.destination}")
+                return None
+            if not isinstance(next_hop, VirtualNode):
+                next_hop.write(header, payload)
+                return next_hop
+            node = next_hop
+
+
+class NodeRuntime:
+    """
+    A class to host any number of nodes on one asyncio event loop in one
+    process.
+
+    Every hosted node listens on its own port and talks to the controller
+    like a TCPNode, but the RSA key, port mapping and outbound connections
+    are shared, and hops between hosted nodes never leave memory.
+
+    Attributes:
+    server_host (str): Hostname or IP address of the controller.
+    server_port (int): Port number of the controller.
+    port_mapping (dict): Node names to listening ports, as in port_mapping.json.
+    node_ids (dict): Node names to the ids carried in message headers.
+    nodes (dict): The hosted VirtualNode of each node name.
+    channels (dict): The StreamChannel of each port or Unix socket path outside the runtime.
+    ipc_paths (dict): Node names to the Unix socket path they also listen on, for every node
+        hosted by a runtime on this machine.
+    """
+
+    def __init__(self, server_host, server_port, port_mapping, node_names=None, client_port_offset=1000, ipc_paths=None):
+        """
+        Parameters:
+        server_host (str): Hostname or IP address of the controller.
+        server_port (int): Port number of the controller.
+        port_mapping (dict): Node names to listening ports.
+        node_names (list): Names of the nodes to host (default is every node in port_mapping).
+        client_port_offset (int): Distance from each node's listening port to its client's port.
+        ipc_paths (dict): Node names to Unix socket paths, for nodes hosted by runtimes on this machine.
+        """
+        self.server_host = server_host
+        self.server_port = server_port
+        self.port_mapping = port_mapping
+        self.node_ids = node_ids(port_mapping)
+        self.channels = {}
+        self.ipc_paths = ipc_paths or {}
+
+        # The key is loaded once for all hosted nodes
+        with open('pub_key.txt', 'rb') as file_pub:
+            self.public_key = pickle.load(file_pub)
+
+        self.nodes = {}
+        for node_name in node_names or port_mapping:
+            listen_port = port_mapping[node_name]
+            self.nodes[node_name] = VirtualNode(self, node_name, listen_port, listen_port + client_port_offset)
+
+    def channel(self, port, path=None):
+        """
+        Returns the connection to a port, or to a Unix socket path, outside
+        the runtime, creating it on first use.
+        """
+        key = path or port
+        if key not in self.channels:
+            self.channels[key] = StreamChannel("localhost", port, path)
+        return self.channels[key]
+
+    async def run(self):
+        """
+        Starts every hosted node and runs until cancelled.
+        """
+        servers = []
+        tasks = []
+        for node in self.nodes.values():
+            servers.append(await asyncio.start_server(node.handle_connection, "localhost", node.listen_port))
+            path = self.ipc_paths.get(node.node_name)
+            if path is not None:
+                if os.path.exists(path):
+                    os.unlink(path)
+                servers.append(await asyncio.start_unix_server(node.handle_connection, path))
+            tasks.append(asyncio.ensure_future(node.subscribe_to_controller()))
+            tasks.append(asyncio.ensure_future(node.poll_controller()))
+        print(f"Runtime hosting {len(self.nodes)} nodes")
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for server in servers:
+                server.close()
+
+
+# Ejemplo de uso
+# Hosts every node in port_mapping.json, or only the ones named on the command line
+if __name__ == "__main__":
+    with open("port_mapping.json", "r") as file:
+        port_mapping = json.load(file)
+    runtime = NodeRuntime("localhost", 1000, port_mapping, sys.argv[1:])
+    asyncio.run(runtime.run())
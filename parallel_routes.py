@@ -0,0 +1,108 @@
+import heapq
+import os
+import numpy as np
+from dijkstra_paths import graph_arrays
+from compact_network import CompactNetwork
+
+
+def compact_topology(network):
+    """
+    Builds a compact, read-only copy of the network topology for workers.
+
+    Parameters:
+    -----------
+    network : Network or CompactNetwork
+        The network object containing nodes and links. A CompactNetwork
+        already keeps its adjacency in this form and is used as is.
+
+    Returns:
+    --------
+    tuple
+        (names, topology), where topology is an (offsets, neighbors, weights)
+        CSR adjacency of NumPy arrays indexed by position in names.
+    """
+    if isinstance(network, CompactNetwork):
+        names, offsets, neighbors, weights = network.csr()
+        return names, (offsets, neighbors, weights)
+    names, sources, destinations, weights = graph_arrays(network)
+    # graph_arrays lists both directions sorted by destination, so grouping
+    # by destination gives the neighbours of every node.
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(destinations, minlength=len(names)), out=offsets[1:])
+    return names, (offsets, sources, weights)
+
+
+def next_hop_rows(topology, sources):
+    """
+    Runs Dijkstra from each source and returns its next-hop row.
+
+    This is the task executed by the worker processes.
+
+    Parameters:
+    -----------
+    topology : tuple
+        The CSR adjacency returned by compact_topology.
+    sources : numpy.ndarray
+        The node indices to compute rows for.
+
+    Returns:
+    --------
+    tuple
+        (sources, rows), where rows[i, j] is the index of the first hop from
+        sources[i] towards node j, sources[i] itself when j is the source,
+        and -1 if j is unreachable.
+    """
+    offsets, neighbors, weights = (array.tolist() for array in topology)
+    node_count = len(offsets) - 1
+    rows = np.full((len(sources), node_count), -1, dtype=np.int32)
+    for row, source in zip(rows, sources.tolist()):
+        distances = {source: 0}
+        first_hops = {source: source}
+        heap = [(0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            first_hop = first_hops[node]
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbor = neighbors[edge]
+                candidate = distance + weights[edge]
+                if candidate < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = candidate
+                    first_hops[neighbor] = neighbor if node == source else first_hop
+                    heapq.heappush(heap, (candidate, neighbor))
+        row[list(first_hops)] = list(first_hops.values())
+    return sources, rows
+
+
+def compute_next_hops_parallel(network, executor, shards=None):
+    """
+    Computes the all-pairs next-hop matrix by sharding sources over a
+    process pool.
+
+    Parameters:
+    -----------
+    network : Network
+        The network object containing nodes and links.
+    executor : concurrent.futures.ProcessPoolExecutor
+        The pool running the shards.
+    shards : int, optional
+        The number of shards (default is four per CPU core).
+
+    Returns:
+    --------
+    tuple
+        (names, next_hops), where next_hops[i] is the row returned by
+        next_hop_rows for node names[i].
+    """
+    names, topology = compact_topology(network)
+    if shards is None:
+        shards = 4 * (os.cpu_count() or 1)
+    next_hops = np.full((len(names), len(names)), -1, dtype=np.int32)
+    chunks = [chunk for chunk in np.array_split(np.arange(len(names)), shards) if len(chunk)]
+    futures = [executor.submit(next_hop_rows, topology, chunk) for chunk in chunks]
+    for future in futures:
+        sources, rows = future.result()
+        next_hops[sources] = rows
+    return names, next_hops
+
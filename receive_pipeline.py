@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor
+import rsa
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from audio_codec import decode_chunk
+from session_crypto import session_decrypt, session_of
+from wire import MESSAGE_AUDIO, MESSAGE_SESSION, SESSION_FLAG, MessageReader
+
+# Marks the end of the received messages
+_DONE = object()
+
+# State of each worker process: the RSA private key, and the ciphers of the most recent session keys
+_private_key = None
+_ciphers = OrderedDict()
+_MAX_CIPHERS = 256
+
+
+def _initialize(private_key):
+    global _private_key
+    _private_key = private_key
+
+
+def _decrypt(payload, key, audio):
+    if key is None:
+        plaintext = rsa.decrypt(payload, _private_key)
+    else:
+        aead = _ciphers.get(key)
+        if aead is None:
+            aead = _ciphers[key] = AESGCM(key)
+            while len(_ciphers) > _MAX_CIPHERS:
+                _ciphers.popitem(last=False)
+        plaintext = session_decrypt(aead, payload)
+    return decode_chunk(plaintext) if audio else plaintext
+
+
+class DecryptPool:
+    """
+    A pool of processes decrypting received payloads, and decoding the
+    audio chunks among them.
+
+    RSA decryption runs in pure Python and holds the GIL, and decoding
+    compressed audio is CPU-bound as well, so the work is spread over
+    processes rather than threads: with one process per core, decrypt
+    throughput grows with the cores. Each worker process receives the RSA
+    private key once when it starts; session keys travel with the payloads
+    they decrypt. Where possible the workers are started by a fork server,
+    so they do not inherit the sockets and threads of the client: a
+    connection closed by the client would otherwise stay open in them.
+
+    Attributes:
+    processes (int): Number of worker processes.
+    depth (int): Most messages of one connection being decrypted at a time.
+    """
+
+    def __init__(self, private_key, processes=None, depth=64):
+        """
+        Creates the pool; its processes start with the first payload.
+
+        Parameters:
+        private_key (rsa.PrivateKey): RSA private key to decrypt the messages not sent in a session.
+        processes (int): Number of worker processes (default is one per core).
+        depth (int): Most messages of one connection being decrypted at a time.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.depth = depth
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+        self.executor = ProcessPoolExecutor(self.processes, context, _initialize, (private_key,))
+
+    def submit(self, payload, key=None, audio=False):
+        """
+        Queues the decryption of a payload.
+
+        Parameters:
+        payload (bytes): The encrypted payload.
+        key (bytes): The key of the payload's session, or None if it is RSA-encrypted.
+        audio (bool): Whether the plaintext is an audio chunk to decode.
+
+        Returns:
+        concurrent.futures.Future: The future plaintext.
+        """
+        return self.executor.submit(_decrypt, payload, key, audio)
+
+    def close(self):
+        """
+        Stops the worker processes, dropping the payloads not yet decrypted.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def receive_decrypted(sock, pool, sessions, on_error=None):
+    """
+    Receives the messages of a connection and decrypts them in a pool of
+    processes, yielding them in the order they arrived.
+
+    A thread reads the connection and hands each payload to the pool as
+    soon as it is received, so up to pool.depth messages are decrypted at
+    once while the caller handles the earlier ones. When the caller falls
+    behind, the reader waits, and the sender with it. Session keys are
+    accepted by the reader itself, since the messages after them need them.
+
+    A message that cannot be decrypted or decoded, such as one failing
+    authentication or sent in an unknown session, is passed to on_error
+    and skipped, and the messages after it are still received. Without
+    on_error it ends the connection. Errors in the framing always end it,
+    since the following messages cannot be found.
+
+    Parameters:
+    sock (socket.socket): The connection.
+    pool (DecryptPool): Pool the payloads are decrypted in.
+    sessions (session_crypto.SessionKeys): Session keys received so far, shared by all connections.
+    on_error (callable): Called with the header of a message and the exception it raised, or None.
+
+    Yields:
+    tuple: (Header, session id or None, plaintext) of each message; the plaintext of an audio
+    message is decoded (see audio_codec), and that of a session key message is None.
+    """
+    results = queue.Queue(pool.depth)
+    errors = []
+
+    def read():
+        try:
+            reader = MessageReader(sock)
+            while (message := reader.read()) is not None:
+                header, payload = message
+                session_id = None
+                try:
+                    if header.type == MESSAGE_SESSION:
+                        results.put((header, sessions.accept(payload), None))
+                        continue
+                    audio = header.type & ~SESSION_FLAG == MESSAGE_AUDIO
+                    if header.type & SESSION_FLAG:
+                        session_id = session_of(payload)
+                        future = pool.submit(bytes(payload), sessions.key(session_id), audio)
+                    else:
+                        future = pool.submit(bytes(payload), None, audio)
+                except Exception as e:
+                    # Only this message is lost; the consumer decides whether to go on
+                    future = Future()
+                    future.set_exception(e)
+                results.put((header, session_id, future))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            results.put(_DONE)
+
+    threading.Thread(target=read, daemon=True).start()
+    item = None
+    try:
+        while (item := results.get()) is not _DONE:
+            header, session_id, future = item
+            try:
+                plaintext = None if future is None else future.result()
+            except Exception as e:
+                # Without a working pool no later message can be decrypted either
+                if on_error is None or isinstance(e, BrokenExecutor):
+                    raise
+                on_error(header, e)
+                continue
+            yield header, session_id, plaintext
+    finally:
+        if item is not _DONE:
+            # The caller stopped early: stop the reader and wait for it to finish
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            while results.get() is not _DONE:
+                pass
+    if errors:
+        raise errors[0]
@@ -0,0 +1,402 @@
+import json
+import os
+import tempfile
+from collections import deque
+import numpy as np
+
+
+class NextHopTable:
+    """
+    A class to represent the routing tables of all nodes as next hops.
+
+    Instead of a full path per (source, destination) pair, the table keeps a
+    shared list of node names and an integer matrix where next_hops[i][j] is
+    the index of the neighbour of node i on its shortest path to node j
+    (i itself when j == i, -1 when j is unreachable). Full paths are rebuilt
+    on demand by following the next hops.
+
+    Attributes:
+    -----------
+    nodes : list
+        The node names shared by all rows and columns.
+    index : dict
+        A dictionary of node names to their position in nodes.
+    next_hops : numpy.ndarray
+        The N x N int32 next-hop matrix.
+
+    Methods:
+    --------
+    from_paths(all_paths):
+        Builds the table from a {source: {destination: path}} dictionary.
+
+    from_predecessors(nodes, predecessors):
+        Builds the table from a predecessor matrix.
+
+    next_hop(source, destination):
+        Returns the next hop from source towards destination.
+
+    path(source, destination):
+        Rebuilds the shortest path from source to destination.
+
+    node_entry(source):
+        Returns the compact routing table sent to a single node.
+
+    to_json(), from_json(data):
+        Convert the table to and from its JSON representation.
+    """
+
+    def __init__(self, nodes, next_hops):
+        """
+        Constructs the table from node names and a next-hop matrix.
+
+        Parameters:
+        -----------
+        nodes : list
+            The node names, indexed like the rows and columns of next_hops.
+        next_hops : array_like
+            The N x N next-hop matrix.
+        """
+        self.nodes = list(nodes)
+        self.index = {name: i for i, name in enumerate(self.nodes)}
+        self.next_hops = np.asarray(next_hops, dtype=np.int32).reshape(len(self.nodes), len(self.nodes))
+
+    @classmethod
+    def from_paths(cls, all_paths):
+        """
+        Builds the table from a {source: {destination: path}} dictionary,
+        as produced by networkx or the engines in dijkstra_paths.
+        """
+        nodes = list(all_paths)
+        index = {name: i for i, name in enumerate(nodes)}
+        next_hops = np.full((len(nodes), len(nodes)), -1, dtype=np.int32)
+        for source, paths in all_paths.items():
+            row = next_hops[index[source]]
+            for destination, path in paths.items():
+                if path:
+                    row[index[destination]] = index[path[1]] if len(path) > 1 else index[source]
+        return cls(nodes, next_hops)
+
+    @classmethod
+    def from_predecessors(cls, nodes, predecessors):
+        """
+        Builds the table from a predecessor matrix, such as the one returned
+        by dijkstra_paths.compute_shortest_paths_floyd_warshall.
+
+        Raises:
+        -------
+        ValueError
+            If the predecessors of a source form a cycle instead of a tree.
+        """
+        predecessors = np.asarray(predecessors)
+        rows, columns = np.indices(predecessors.shape)
+        next_hops = np.where(predecessors == rows, columns, -1)
+        np.fill_diagonal(next_hops, np.arange(len(nodes)))
+        # The next hop towards j is the next hop towards the predecessor of j;
+        # each pass resolves the destinations one hop further away, so a tree
+        # needs fewer passes than there are nodes.
+        for _ in range(len(nodes)):
+            pending = (next_hops < 0) & (predecessors >= 0)
+            resolved = pending & (next_hops[rows, np.maximum(predecessors, 0)] >= 0)
+            if not resolved.any():
+                break
+            next_hops[resolved] = next_hops[rows[resolved], predecessors[resolved]]
+        if ((next_hops < 0) & (predecessors >= 0)).any():
+            raise ValueError("The predecessors contain a cycle")
+        return cls(nodes, next_hops)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def next_hop(self, source, destination):
+        """
+        Returns the name of the next hop from source towards destination,
+        or None if there is no route.
+        """
+        if source not in self.index or destination not in self.index:
+            return None
+        hop = self.next_hops[self.index[source], self.index[destination]]
+        return self.nodes[hop] if hop >= 0 else None
+
+    def path(self, source, destination):
+        """
+        Rebuilds the shortest path from source to destination.
+
+        Returns:
+        --------
+        list
+            The node names of the path, or None if there is no route.
+        """
+        if self.next_hop(source, destination) is None:
+            return None
+        current, target = self.index[source], self.index[destination]
+        path = [current]
+        while current != target:
+            if len(path) > len(self.nodes):
+                raise ValueError(f"Routing loop on the path from {source} to {destination}")
+            current = int(self.next_hops[current, target])
+            path.append(current)
+        return [self.nodes[step] for step in path]
+
+    def node_entry(self, source):
+        """
+        Returns the compact routing table of a single node, as sent to it by
+        the controller: the shared node names plus its own next-hop row.
+        """
+        return {"nodes": self.nodes, "next_hop": self.next_hops[self.index[source]].tolist()}
+
+    def to_json(self):
+        """
+        Returns the JSON-serializable representation of the table.
+        """
+        return {"nodes": self.nodes, "next_hop": self.next_hops.tolist()}
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Builds the table from the representation returned by to_json.
+        """
+        return cls(data["nodes"], data["next_hop"])
+
+
+class TableChangelog:
+    """
+    A class to track versions of the routing tables and the changes
+    between them.
+
+    Every computed table that differs from the previous one gets a new
+    version. For each version the changelog records, per node, the
+    destinations whose next hop changed, so that a node reporting an older
+    version can be sent only those entries. The changelog is bounded; nodes
+    further behind, or behind a change of the node set, get a full table.
+    Versions restart from 1 with every changelog, so each changelog also
+    has a random epoch: a version reported under another epoch, e.g. from
+    before a controller restart, says nothing about the current tables.
+
+    Attributes:
+    -----------
+    epoch : str
+        The random identifier of this changelog.
+    version : int
+        The version of the current table (0 before the first table).
+    table : NextHopTable
+        The current table.
+    entries : collections.deque
+        (version, changes) pairs of the most recent versions, where changes
+        maps node names to {destination index: next hop index}, or is None
+        if the node set changed.
+    """
+
+    def __init__(self, max_entries=32):
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self.table = None
+        self.entries = deque(maxlen=max_entries)
+
+    def is_current(self, table):
+        """
+        Returns True if table has the same routes as the current table.
+        """
+        old = self.table
+        return (old is not None and old.nodes == table.nodes and
+                np.array_equal(old.next_hops, table.next_hops))
+
+    def update(self, table):
+        """
+        Records a newly computed table.
+
+        Returns:
+        --------
+        bool
+            True if the table differs from the current one and a new version
+            was created.
+        """
+        old = self.table
+        if old is not None and old.nodes == table.nodes:
+            differences = old.next_hops != table.next_hops
+            if not differences.any():
+                return False
+            changes = {}
+            for row in np.flatnonzero(differences.any(axis=1)):
+                columns = np.flatnonzero(differences[row])
+                changes[table.nodes[row]] = dict(zip(columns.tolist(), table.next_hops[row, columns].tolist()))
+        else:
+            changes = None
+        self.version += 1
+        self.table = table
+        self.entries.append((self.version, changes))
+        return True
+
+    def changes_since(self, node, version):
+        """
+        Returns the next-hop changes of node between version and the
+        current version, or None if they are no longer available.
+
+        Returns:
+        --------
+        dict
+            A dictionary of destination indexes to next hop indexes.
+        """
+        if not self.entries or not self.entries[0][0] - 1 <= version <= self.version:
+            return None
+        merged = {}
+        for entry_version, changes in self.entries:
+            if entry_version <= version:
+                continue
+            if changes is None:
+                return None
+            merged.update(changes.get(node, {}))
+        return merged
+
+
+class NodeRoutingTable:
+    """
+    A class to represent the routing table received by a single node.
+
+    Attributes:
+    -----------
+    nodes : list
+        The node names the next-hop row is indexed by.
+    next_hops : list
+        The index of the next hop towards every node (-1 if unreachable).
+    version : int
+        The controller table version this table corresponds to.
+    epoch : str
+        The epoch of the controller changelog the version belongs to.
+    """
+
+    def __init__(self, nodes, next_hops, version=0, epoch=None):
+        self.nodes = nodes
+        self.next_hops = next_hops
+        self.version = version
+        self.epoch = epoch
+        self.index = {name: i for i, name in enumerate(nodes)}
+
+    @classmethod
+    def from_entry(cls, entry):
+        """
+        Builds the table from the entry returned by NextHopTable.node_entry.
+        """
+        return cls(entry["nodes"], entry["next_hop"], entry.get("version", 0), entry.get("epoch"))
+
+    @property
+    def request_version(self):
+        """
+        The version to report to the controller, as "<epoch>.<version>".
+        """
+        return f"{self.epoch}.{self.version}"
+
+    def next_hop(self, destination):
+        """
+        Returns the name of the next hop towards destination (the node's own
+        name when it is the destination), or None if there is no route.
+        """
+        position = self.index.get(destination)
+        if position is None or self.next_hops[position] < 0:
+            return None
+        return self.nodes[self.next_hops[position]]
+
+    def __repr__(self):
+        routes = {name: self.next_hop(name) for name in self.nodes}
+        return f"NodeRoutingTable({routes})"
+
+
+def apply_routing_update(table, response):
+    """
+    Applies a controller response to a node's routing table.
+
+    The response is either a full entry ({"version", "nodes", "next_hop"}),
+    a delta ({"version", "base", "changes"}) against the node's current
+    version, or {"version", "status": "not_modified"}. Each also carries
+    the "epoch" of the controller changelog.
+
+    Parameters:
+    -----------
+    table : NodeRoutingTable
+        The current table, or None if the node has none yet.
+    response : dict
+        The decoded controller response.
+
+    Returns:
+    --------
+    NodeRoutingTable
+        The updated table. A new object is returned whenever the routes
+        change, so readers of the previous table are never affected.
+    """
+    if response.get("status") == "not_modified":
+        return table
+    same_epoch = table is not None and table.epoch == response.get("epoch")
+    if same_epoch and response["version"] < table.version:
+        # Older than a table already received through the other channel (push or poll)
+        return table
+    if "changes" in response:
+        if same_epoch and response["version"] == table.version:
+            return table
+        if not same_epoch or table.version != response["base"]:
+            raise ValueError(f"Routing delta against version {response['base']} does not apply")
+        next_hops = list(table.next_hops)
+        for destination, next_hop in response["changes"].items():
+            next_hops[int(destination)] = next_hop
+        return NodeRoutingTable(table.nodes, next_hops, response["version"], table.epoch)
+    return NodeRoutingTable.from_entry(response)
+
+
+def compile_forwarding_table(table, node_ids, channel_for):
+    """
+    Compiles a node's routing table into a forwarding table that maps the
+    destination ids carried in message headers straight to outbound
+    channels, so forwarding a message takes a single dictionary lookup.
+
+    Parameters:
+    -----------
+    table : NodeRoutingTable
+        The routing table of the node.
+    node_ids : dict
+        A dictionary of node names to header ids (see wire.node_ids).
+    channel_for : callable
+        Called with a next hop name (the node's own name for local
+        delivery); returns the channel to send through, or None if the next
+        hop cannot be reached.
+
+    Returns:
+    --------
+    dict
+        A dictionary of destination ids to channels. Unreachable
+        destinations are left out.
+    """
+    channels = {}
+    forwarding_table = {}
+    for destination in table.nodes:
+        next_hop = table.next_hop(destination)
+        if next_hop is None or destination not in node_ids:
+            continue
+        if next_hop not in channels:
+            channels[next_hop] = channel_for(next_hop)
+        if channels[next_hop] is not None:
+            forwarding_table[node_ids[destination]] = channels[next_hop]
+    return forwarding_table
+
+
+def save_routing_tables(table, filename="routing_tables.json"):
+    """
+    Writes a NextHopTable to a JSON file.
+
+    The table is written to a temporary file in the same directory, which
+    then replaces the target in one step, so readers find either the
+    previous table or the new one, never a partly written file.
+    """
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(table.to_json(), file)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def load_routing_tables(filename="routing_tables.json"):
+    """
+    Reads a NextHopTable from a JSON file.
+    """
+    with open(filename, "r") as file:
+        return NextHopTable.from_json(json.load(file))
@@ -0,0 +1,150 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+import rsa
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Session payloads start with the session id and chunk counter, which together form the AES-GCM nonce
+SESSION_ID = struct.Struct("!I")
+NONCE = struct.Struct("!IQ")
+KEY_BITS = 256
+TAG_SIZE = 16
+
+
+class SessionEncryptor:
+    """
+    Encrypts the payloads of one flow with a fresh symmetric key.
+
+    The AES-GCM key is encrypted once with the recipient's RSA public key
+    and sent ahead of the flow as the handshake; every payload after it
+    costs a single AEAD operation whatever its size, and only grows by the
+    12-byte nonce and the 16-byte tag. Nonces are never reused: each chunk
+    takes the next value of a counter under a key used by no other flow.
+
+    Attributes:
+    session_id (int): Random id the recipient finds the key by.
+    handshake (bytes): Payload of the key exchange message: the session id and the RSA-encrypted key.
+    counter (int): Number of chunks encrypted so far.
+    """
+
+    def __init__(self, public_key):
+        """
+        Generates the session key and its handshake.
+
+        Parameters:
+        public_key (rsa.PublicKey): Recipient's RSA public key.
+        """
+        key = AESGCM.generate_key(bit_length=KEY_BITS)
+        self.session_id = SESSION_ID.unpack(os.urandom(SESSION_ID.size))[0]
+        self.handshake = SESSION_ID.pack(self.session_id) + rsa.encrypt(key, public_key)
+        self.aead = AESGCM(key)
+        self.counter = 0
+
+    def encrypt(self, chunk):
+        """
+        Encrypts the next chunk of the flow.
+
+        Parameters:
+        chunk (bytes): Plaintext of any size.
+
+        Returns:
+        bytes: The nonce followed by the ciphertext and its tag.
+        """
+        nonce = NONCE.pack(self.session_id, self.counter)
+        self.counter += 1
+        return nonce + self.aead.encrypt(nonce, chunk, None)
+
+
+def session_of(payload):
+    """
+    Returns the session id of a payload encrypted by a SessionEncryptor.
+    """
+    return SESSION_ID.unpack_from(payload)[0]
+
+
+def session_decrypt(aead, payload):
+    """
+    Decrypts and authenticates a payload encrypted by a SessionEncryptor.
+
+    Parameters:
+    aead (AESGCM): The cipher of the payload's session.
+    payload (bytes or memoryview): The nonce followed by the ciphertext and its tag.
+
+    Returns:
+    bytes: The plaintext.
+
+    Raises:
+    cryptography.exceptions.InvalidTag: If the payload was altered.
+    """
+    return aead.decrypt(bytes(payload[:NONCE.size]), bytes(payload[NONCE.size:]), None)
+
+
+class SessionKeys:
+    """
+    The session keys received by a recipient, by session id.
+
+    Only the most recently used sessions are kept. One instance is shared
+    by the threads of every connection, so it is guarded by a lock.
+
+    Attributes:
+    private_key (rsa.PrivateKey): RSA private key the handshakes are decrypted with.
+    max_sessions (int): Most sessions kept.
+    """
+
+    def __init__(self, private_key, max_sessions=256):
+        self.private_key = private_key
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def accept(self, handshake):
+        """
+        Decrypts the key of a new session from its handshake.
+
+        Parameters:
+        handshake (bytes): The handshake payload sent by a SessionEncryptor.
+
+        Returns:
+        int: The session id.
+        """
+        (session_id,) = SESSION_ID.unpack_from(handshake)
+        key = rsa.decrypt(bytes(handshake[SESSION_ID.size:]), self.private_key)
+        with self.lock:
+            self.sessions[session_id] = (key, AESGCM(key))
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return session_id
+
+    def key(self, session_id):
+        """
+        Returns the key of a session, for decrypting its payloads elsewhere.
+        The session becomes the most recently used one.
+
+        Raises:
+        KeyError: If the session is unknown.
+        """
+        with self.lock:
+            self.sessions.move_to_end(session_id)
+            return self.sessions[session_id][0]
+
+    def decrypt(self, payload):
+        """
+        Decrypts and authenticates a payload encrypted by a SessionEncryptor.
+
+        Parameters:
+        payload (bytes or memoryview): The nonce followed by the ciphertext and its tag.
+
+        Returns:
+        bytes: The plaintext.
+
+        Raises:
+        KeyError: If the session is unknown.
+        cryptography.exceptions.InvalidTag: If the payload was altered.
+        """
+        session_id = session_of(payload)
+        with self.lock:
+            self.sessions.move_to_end(session_id)
+            aead = self.sessions[session_id][1]
+        return session_decrypt(aead, payload)
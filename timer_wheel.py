@@ -0,0 +1,126 @@
+import math
+import threading
+import time
+
+
+class TimerWheel:
+    """
+    A class to implement a hashed timer wheel for node liveness tracking.
+
+    Keys are kept in a ring of slots, one per tick of the given resolution.
+    Refreshing a key moves it to the slot that is due timeout seconds from
+    now, and each tick expires the whole slot it reaches. Both operations
+    are O(1) per key, and keys expiring in the same tick are reported
+    together in a single callback. The ring spans the whole timeout, so no
+    overflow levels are needed.
+
+    Attributes:
+    -----------
+    timeout : float
+        Seconds after the last refresh at which a key expires.
+    resolution : float
+        Seconds per tick; keys expire up to one tick late.
+    on_expire : callable
+        Called with the list of keys expired by a tick.
+
+    Methods:
+    --------
+    refresh(key):
+        Starts or restarts the timeout of key.
+
+    remove(key):
+        Stops tracking key.
+
+    tick():
+        Advances the wheel by one slot and expires its keys.
+
+    run():
+        Ticks the wheel forever in the calling thread.
+
+    start():
+        Ticks the wheel from a background thread.
+    """
+
+    def __init__(self, timeout, on_expire, resolution=1.0):
+        """
+        Constructs an empty wheel.
+
+        Parameters:
+        -----------
+        timeout : float
+            Seconds after the last refresh at which a key expires.
+        on_expire : callable
+            Called with the list of keys expired by a tick.
+        resolution : float, optional
+            Seconds per tick (default is 1.0).
+        """
+        self.timeout = timeout
+        self.resolution = resolution
+        self.on_expire = on_expire
+        self.ticks = max(1, math.ceil(timeout / resolution))
+        self.slots = [set() for _ in range(self.ticks + 1)]
+        self.slot_of = {}
+        self.current = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, key):
+        """
+        Starts or restarts the timeout of key.
+        """
+        with self._lock:
+            slot = self.slot_of.get(key)
+            if slot is not None:
+                self.slots[slot].discard(key)
+            slot = (self.current + self.ticks) % len(self.slots)
+            self.slots[slot].add(key)
+            self.slot_of[key] = slot
+
+    def remove(self, key):
+        """
+        Stops tracking key.
+        """
+        with self._lock:
+            slot = self.slot_of.pop(key, None)
+            if slot is not None:
+                self.slots[slot].discard(key)
+
+    def __contains__(self, key):
+        return key in self.slot_of
+
+    def tick(self):
+        """
+        Advances the wheel by one slot and expires the keys due in it.
+
+        Returns:
+        --------
+        list
+            The expired keys, also passed to on_expire if not empty.
+        """
+        with self._lock:
+            self.current = (self.current + 1) % len(self.slots)
+            expired = list(self.slots[self.current])
+            self.slots[self.current].clear()
+            for key in expired:
+                del self.slot_of[key]
+        if expired:
+            self.on_expire(expired)
+        return expired
+
+    def run(self):
+        """
+        Ticks the wheel every resolution seconds, without drift.
+        """
+        deadline = time.monotonic()
+        while True:
+            deadline += self.resolution
+            time.sleep(max(0, deadline - time.monotonic()))
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error expiring timers: {e}")
+
+    def start(self):
+        """
+        Ticks the wheel from a background daemon thread.
+        """
+        threading.Thread(target=self.run, daemon=True).start()
@@ -0,0 +1,357 @@
+import asyncio
+import struct
+from collections import namedtuple
+
+# Every frame on a stream starts with its payload length
+FRAME_LENGTH = struct.Struct("!I")
+
+# Sent by a node on its routing table subscription to report that it is alive
+HEARTBEAT = b"\x00"
+
+# Data plane messages start with a fixed header:
+# version, type, origin id, destination id, sequence, TTL, payload length
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct("!BBHHIBI")
+Header = namedtuple("Header", "version type origin destination sequence ttl length")
+
+MESSAGE_USER = 1
+MESSAGE_AUDIO = 2
+# Carries the RSA-encrypted key of a session (see session_crypto)
+MESSAGE_SESSION = 3
+MESSAGE_TYPES = {"user_message": MESSAGE_USER, "audio_message": MESSAGE_AUDIO, "session_key": MESSAGE_SESSION}
+# Set in the type of messages whose payload is encrypted with a session key instead of RSA
+SESSION_FLAG = 0x80
+
+# Most buffers passed to a single sendmsg call
+IOV_MAX = 1024
+
+DEFAULT_TTL = 64
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+
+def node_ids(port_mapping):
+    """
+    Assigns the numeric node ids carried in message headers.
+
+    Parameters:
+    port_mapping (dict): Port mapping of node names to listening ports, as in port_mapping.json.
+
+    Returns:
+    dict: Node name to id, numbered from 1 in port mapping order.
+    """
+    return {name: position for position, name in enumerate(port_mapping, start=1)}
+
+
+def recv_into_exact(sock, view, allow_eof=False):
+    """
+    Fills a writable buffer with bytes received from a socket.
+
+    Parameters:
+    sock (socket.socket): Socket to read from.
+    view (memoryview): Buffer to fill completely.
+    allow_eof (bool): Whether the peer may close the connection before the first byte.
+
+    Returns:
+    bool: True once the buffer is full, False on a permitted end of stream.
+
+    Raises:
+    ConnectionError: If the peer closes the connection part way through.
+    """
+    received = 0
+    while received < len(view):
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            if allow_eof and received == 0:
+                return False
+            raise ConnectionError("Connection closed by peer")
+        received += count
+    return True
+
+
+def recv_exact(sock, size):
+    """
+    Receives exactly size bytes from a socket.
+
+    Parameters:
+    sock (socket.socket): Socket to read from.
+    size (int): Number of bytes to read.
+
+    Returns:
+    bytes: The received bytes.
+
+    Raises:
+    ConnectionError: If the peer closes the connection first.
+    """
+    data = bytearray(size)
+    recv_into_exact(sock, memoryview(data))
+    return bytes(data)
+
+
+def encode_frame(payload):
+    """
+    Returns a payload prefixed with its length, ready to be written.
+
+    Parameters:
+    payload (bytes): Frame payload.
+
+    Returns:
+    bytes: The encoded frame.
+    """
+    return FRAME_LENGTH.pack(len(payload)) + payload
+
+
+def send_frame(sock, payload):
+    """
+    Sends a length-prefixed frame.
+
+    Parameters:
+    sock (socket.socket): Socket to send on.
+    payload (bytes): Frame payload.
+    """
+    sock.sendall(encode_frame(payload))
+
+
+def send_buffers(sock, buffers):
+    """
+    Sends consecutive buffers with as few system calls as possible: one
+    gathering sendmsg, resumed after partial writes, where the platform
+    supports it, and a single sendall of the joined buffers elsewhere.
+
+    Parameters:
+    sock (socket.socket): Socket to send on.
+    buffers (list): Buffers (bytes, bytearray or memoryview) to send in order.
+
+    Raises:
+    OSError: If sending failed. Its bytes_written attribute is the number of
+    bytes sent before the failure, or None if it is not known.
+    """
+    if not hasattr(sock, "sendmsg"):
+        try:
+            sock.sendall(b"".join(buffers))
+        except OSError as e:
+            e.bytes_written = None
+            raise
+        return
+    views = [memoryview(buffer).cast("B") for buffer in buffers]
+    first = 0
+    written = 0
+    while first < len(views):
+        try:
+            sent = sock.sendmsg(views[first:first + IOV_MAX])
+        except OSError as e:
+            e.bytes_written = written
+            raise
+        written += sent
+        while first < len(views) and sent >= len(views[first]):
+            sent -= len(views[first])
+            first += 1
+        if sent:
+            views[first] = views[first][sent:]
+
+
+def recv_frame(sock):
+    """
+    Receives a length-prefixed frame.
+
+    Parameters:
+    sock (socket.socket): Socket to read from.
+
+    Returns:
+    bytes: Frame payload.
+    """
+    (length,) = FRAME_LENGTH.unpack(recv_exact(sock, FRAME_LENGTH.size))
+    return recv_exact(sock, length)
+
+
+async def read_frame(reader):
+    """
+    Reads a length-prefixed frame from an asyncio stream.
+
+    Parameters:
+    reader (asyncio.StreamReader): Stream to read from.
+
+    Returns:
+    bytes: Frame payload.
+
+    Raises:
+    asyncio.IncompleteReadError: If the stream ends first.
+    """
+    (length,) = FRAME_LENGTH.unpack(await reader.readexactly(FRAME_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+def encode_header(message_type, origin, destination, sequence, length, ttl=DEFAULT_TTL):
+    """
+    Packs a data plane message header.
+
+    Parameters:
+    message_type (int): MESSAGE_USER or MESSAGE_AUDIO.
+    origin (int): Id of the origin node.
+    destination (int): Id of the destination node.
+    sequence (int): Sequence number of the message within its flow.
+    length (int): Length of the payload that follows the header.
+    ttl (int): Remaining hops before the message is dropped.
+
+    Returns:
+    bytes: The packed header.
+    """
+    return HEADER.pack(PROTOCOL_VERSION, message_type, origin, destination, sequence, ttl, length)
+
+
+def encode_message(message_type, origin, destination, sequence, payload, ttl=DEFAULT_TTL):
+    """
+    Packs a complete data plane message: header followed by the raw payload.
+
+    Returns:
+    bytes: The encoded message.
+    """
+    return encode_header(message_type, origin, destination, sequence, len(payload), ttl) + payload
+
+
+def parse_header(buffer):
+    """
+    Unpacks a message header from the start of a buffer without copying it.
+
+    Parameters:
+    buffer (bytes, bytearray or memoryview): Buffer starting with a header.
+
+    Returns:
+    Header: The header fields.
+
+    Raises:
+    ValueError: If the protocol version or payload length is invalid.
+    """
+    header = Header._make(HEADER.unpack_from(buffer))
+    if header.version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version {header.version}")
+    if header.length > MAX_PAYLOAD:
+        raise ValueError(f"Payload of {header.length} bytes exceeds the limit")
+    return header
+
+
+async def read_message(reader):
+    """
+    Reads a data plane message from an asyncio stream.
+
+    Parameters:
+    reader (asyncio.StreamReader): Stream to read from.
+
+    Returns:
+    tuple: (Header, bytes payload), or None when the stream ended between messages.
+    """
+    try:
+        header = parse_header(await reader.readexactly(HEADER.size))
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ConnectionError("Connection closed by peer") from e
+        return None
+    return header, await reader.readexactly(header.length)
+
+
+class MessageReader:
+    """
+    Reads data plane messages from a stream socket into a reusable buffer.
+
+    The header is parsed in place and the payload is received with
+    recv_into straight into the preallocated buffer, which only grows when
+    a larger payload arrives. The returned payload is a memoryview of that
+    buffer and is only valid until the next call to read.
+
+    Transit nodes can instead read the header alone and relay the payload
+    to the next hop in buffer-sized chunks, without ever holding it whole.
+
+    Attributes:
+    sock (socket.socket): Socket to read from.
+    buffer (bytearray): Receive buffer for one message.
+    """
+
+    def __init__(self, sock, size=64 * 1024):
+        self.sock = sock
+        self.buffer = bytearray(HEADER.size + size)
+
+    def read(self):
+        """
+        Receives the next message.
+
+        Returns:
+        tuple: (Header, memoryview payload), or None when the peer closed the connection between messages.
+        """
+        header = self.read_header()
+        if header is None:
+            return None
+        return header, self.read_payload(header)
+
+    def read_header(self):
+        """
+        Receives the header of the next message. Its payload must then be
+        consumed with read_payload, relay or skip.
+
+        Returns:
+        Header: The header, or None when the peer closed the connection between messages.
+        """
+        view = memoryview(self.buffer)
+        if not recv_into_exact(self.sock, view[:HEADER.size], allow_eof=True):
+            return None
+        return parse_header(view)
+
+    def read_payload(self, header):
+        """
+        Receives the whole payload of the message whose header was just read.
+
+        Returns:
+        memoryview: The payload, valid until the next read.
+        """
+        if HEADER.size + header.length > len(self.buffer):
+            # Views of the old buffer may still be held by the caller
+            buffer = bytearray(HEADER.size + header.length)
+            buffer[:HEADER.size] = self.buffer[:HEADER.size]
+            self.buffer = buffer
+        payload = memoryview(self.buffer)[HEADER.size:HEADER.size + header.length]
+        recv_into_exact(self.sock, payload)
+        return payload
+
+    def relay(self, header, write):
+        """
+        Streams the message whose header was just read to another stream,
+        with a new header in front of its unchanged payload.
+
+        The payload passes through the buffer in chunks, the first one sent
+        together with the header, so the cost per message does not depend
+        on holding or copying the payload whole. If write fails, the rest of
+        the payload is still consumed, keeping this stream aligned on the
+        next message, and the error is raised at the end.
+
+        Parameters:
+        header (Header): Header to send, usually the received one with a new TTL.
+        write (callable): Called with each consecutive part, such as socket.sendall.
+
+        Raises:
+        ConnectionError: If the peer closes the connection part way through the payload.
+        """
+        view = memoryview(self.buffer)
+        HEADER.pack_into(self.buffer, 0, *header)
+        body = view[HEADER.size:]
+        start, remaining, error = 0, header.length, None
+        while True:
+            count = 0
+            if remaining:
+                count = self.sock.recv_into(body, min(remaining, len(body)))
+                if count == 0:
+                    raise ConnectionError("Connection closed by peer")
+                remaining -= count
+            if error is None:
+                try:
+                    write(view[start:HEADER.size + count])
+                except OSError as e:
+                    error = e
+            start = HEADER.size
+            if not remaining:
+                break
+        if error is not None:
+            raise error
+
+    def skip(self, header):
+        """
+        Discards the payload of the message whose header was just read.
+        """
+        self.relay(header, lambda part: None)
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+
+
+class WorkerPool:
+    """
+    A fixed set of worker threads serving a bounded queue of tasks.
+
+    submit blocks while the queue is full. Called from an accept loop, this
+    stops accepting new connections until a worker is free: further
+    connections wait in the kernel's listen backlog, and senders slow down
+    instead of the receiver growing threads and memory without bound. A
+    task serving a persistent connection keeps its worker for the lifetime
+    of the connection, so the pool must be larger than the number of such
+    connections. stats reports how many tasks have held their worker for
+    long, which shows when such connections are pinning the pool.
+
+    Attributes:
+    workers (int): Number of worker threads.
+    max_queue (int): Most tasks waiting for a worker.
+    queued (int): Tasks waiting for a worker.
+    active (int): Tasks being run.
+    peak_queued (int): Highest number of tasks ever waiting.
+    submitted (int): Tasks submitted so far.
+    completed (int): Tasks finished so far.
+    blocked (int): Submissions that had to wait for room in the queue.
+    long_task (float): Seconds after which a running task counts as long-running.
+    """
+
+    def __init__(self, workers, max_queue, name="worker", long_task=10.0):
+        """
+        Starts the worker threads.
+
+        Parameters:
+        workers (int): Number of worker threads.
+        max_queue (int): Most tasks waiting for a worker.
+        name (str): Prefix of the thread names.
+        long_task (float): Seconds after which a running task counts as long-running.
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.tasks = deque()
+        self.changed = threading.Condition()
+        self.active = 0
+        self.peak_queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.blocked = 0
+        self.long_task = long_task
+        # Start time of the task run by each busy worker
+        self.started = {}
+        for number in range(workers):
+            threading.Thread(target=self._work, args=(number,), name=f"{name}-{number}", daemon=True).start()
+
+    @property
+    def queued(self):
+        return len(self.tasks)
+
+    def submit(self, function, *args):
+        """
+        Queues a call of function with args, waiting while the queue is full.
+        """
+        with self.changed:
+            if len(self.tasks) >= self.max_queue:
+                self.blocked += 1
+                while len(self.tasks) >= self.max_queue:
+                    self.changed.wait()
+            self.tasks.append((function, args))
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, len(self.tasks))
+            self.changed.notify_all()
+
+    def _work(self, number):
+        while True:
+            with self.changed:
+                while not self.tasks:
+                    self.changed.wait()
+                function, args = self.tasks.popleft()
+                self.active += 1
+                self.started[number] = time.monotonic()
+                # Wake a submitter waiting for room
+                self.changed.notify_all()
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Error in worker task: {e}")
+            finally:
+                with self.changed:
+                    self.active -= 1
+                    self.completed += 1
+                    del self.started[number]
+
+    def stats(self):
+        """
+        Returns the queue-depth counters.
+
+        Returns:
+        dict: The queued, active, peak_queued, submitted, completed and blocked counters,
+        with the pool's workers and max_queue, the number of long-running tasks and the
+        age in seconds of the oldest running task.
+        """
+        with self.changed:
+            now = time.monotonic()
+            ages = [now - started for started in self.started.values()]
+            return {"workers": self.workers, "max_queue": self.max_queue, "queued": len(self.tasks),
+                    "active": self.active, "peak_queued": self.peak_queued, "submitted": self.submitted,
+                    "completed": self.completed, "blocked": self.blocked,
+                    "long_running": sum(age >= self.long_task for age in ages),
+                    "oldest_running": round(max(ages, default=0.0), 1)}